@@ -3,6 +3,7 @@
 # requires-python = ">=3.11"
 # dependencies = [
 #     "sqlglot[rs]>=26.0.0",
+#     "orjson>=3.9",
 # ]
 # ///
 """
@@ -13,29 +14,44 @@ Usage:
     uv run analyze_query.py @query.sql --dialect snowflake --format markdown
 """
 
+from __future__ import annotations
+
 import argparse
+import functools
+import hashlib
+import importlib.util
+import io
 import json
+import os
 import sys
-from typing import Any
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, NamedTuple, TextIO
+
+# sqlglot is imported inside the functions that use it: the import costs more
+# than a small analysis, and --help, input errors and cache hits never need it
+if TYPE_CHECKING:
+    from sqlglot import exp
+    from sqlglot.generator import Generator
 
-import sqlglot
-from sqlglot import exp
-from sqlglot.errors import SqlglotError
-from sqlglot.optimizer.qualify import qualify
-from sqlglot.optimizer.scope import build_scope, find_all_in_scope, traverse_scope
+try:
+    import orjson
+except ImportError:  # optional speedup; stdlib json is the fallback
+    orjson = None
+
+_loads = orjson.loads if orjson is not None else json.loads
 
 
 def read_input(value: str) -> str:
     """Read from file if value starts with @, otherwise return as-is."""
-    if value.startswith("@"):
-        try:
-            with open(value[1:], "r", encoding="utf-8") as f:
-                return f.read()
-        except FileNotFoundError:
-            sys.exit(f"Error: File not found: {value[1:]}")
-        except Exception as e:
-            sys.exit(f"Error reading file {value[1:]}: {e}")
-    return value
+    if value[:1] != "@":
+        return value
+    try:
+        return Path(value[1:]).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        sys.exit(f"Error: File not found: {value[1:]}")
+    except Exception as e:
+        sys.exit(f"Error reading file {value[1:]}: {e}")
 
 
 def parse_schema(schema_str: str | None) -> dict | None:
@@ -44,11 +60,23 @@ def parse_schema(schema_str: str | None) -> dict | None:
         return None
     content = read_input(schema_str)
     try:
-        return json.loads(content)
-    except json.JSONDecodeError as e:
+        return _loads(content)
+    except json.JSONDecodeError as e:  # orjson.JSONDecodeError subclasses it
         sys.exit(f"Error: Invalid JSON schema: {e}")
 
 
+def dump_indented(obj: Any, fh: TextIO) -> None:
+    """Write 2-space indented JSON to fh, using orjson when it is installed."""
+    if orjson is not None:
+        out = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        # orjson emits raw UTF-8; keep stdlib's ASCII-escaped output for anything else
+        if out.isascii():
+            fh.write(out.decode())
+            return
+    # Stream chunks instead of building the whole document in memory
+    json.dump(obj, fh, indent=2)
+
+
 def truncate_expr(expr: str | None, max_length: int | None) -> str | None:
     """Truncate expression to max_length if specified."""
     if expr is None or max_length is None or max_length <= 0:
@@ -58,144 +86,221 @@ def truncate_expr(expr: str | None, max_length: int | None) -> str | None:
     return expr[:max_length] + "..."
 
 
+def _with_subclasses(mapping: dict[type, str]) -> dict[type, str]:
+    """Expand a type map so exact type() lookups also match known subclasses."""
+    expanded = dict(mapping)
+    for cls, value in mapping.items():
+        stack = list(cls.__subclasses__())
+        while stack:
+            sub = stack.pop()
+            expanded.setdefault(sub, value)
+            stack.extend(sub.__subclasses__())
+    return expanded
+
+
+class _DispatchTables(NamedTuple):
+    agg_types: tuple[type, ...]
+    agg_names: dict[type, str]
+    transform: dict[type, str]
+    infer: dict[type, str]
+    window: dict[type, str]
+    collect: dict[type, str]
+
+
+@functools.cache
+def _dispatch_tables() -> _DispatchTables:
+    """Build the type dispatch tables on first use, once sqlglot is imported."""
+    from sqlglot import exp
+
+    # Aggregate functions reported by extract_aggregation_info
+    agg_funcs: dict[type, str] = {
+        exp.Sum: "SUM",
+        exp.Avg: "AVG",
+        exp.Count: "COUNT",
+        exp.Min: "MIN",
+        exp.Max: "MAX",
+    }
+    agg_types = tuple(agg_funcs)
+
+    # Leaf-type dispatch tables, probed with type(expr) instead of isinstance ladders
+    return _DispatchTables(
+        agg_types=agg_types,
+        agg_names=_with_subclasses(agg_funcs),
+        transform=_with_subclasses({
+            exp.Column: "passthrough",
+            **dict.fromkeys(agg_types, "aggregated"),
+            exp.Window: "window_function",
+        }),
+        infer=_with_subclasses({
+            # Aggregation functions have known return types
+            exp.Count: "BIGINT",
+            exp.Sum: "NUMERIC",
+            exp.Avg: "DOUBLE",
+            exp.Min: "INHERITED",  # Same type as input
+            exp.Max: "INHERITED",
+            # Boolean expressions
+            exp.EQ: "BOOLEAN",
+            exp.NEQ: "BOOLEAN",
+            exp.GT: "BOOLEAN",
+            exp.GTE: "BOOLEAN",
+            exp.LT: "BOOLEAN",
+            exp.LTE: "BOOLEAN",
+            exp.And: "BOOLEAN",
+            exp.Or: "BOOLEAN",
+            exp.Not: "BOOLEAN",
+            exp.In: "BOOLEAN",
+            exp.Between: "BOOLEAN",
+            exp.Is: "BOOLEAN",
+            exp.Like: "BOOLEAN",
+            # String functions
+            exp.Concat: "VARCHAR",
+            exp.Substring: "VARCHAR",
+            exp.Upper: "VARCHAR",
+            exp.Lower: "VARCHAR",
+            exp.Trim: "VARCHAR",
+            exp.Replace: "VARCHAR",
+            # Date/time functions
+            exp.CurrentDate: "TIMESTAMP",
+            exp.CurrentTimestamp: "TIMESTAMP",
+            exp.DateTrunc: "TIMESTAMP",
+            exp.Extract: "INTEGER",
+            exp.DateDiff: "INTEGER",
+            # Arithmetic - preserve numeric type
+            exp.Add: "NUMERIC",
+            exp.Sub: "NUMERIC",
+            exp.Mul: "NUMERIC",
+            exp.Div: "NUMERIC",
+            # Coalesce/NVL - inherit from first non-null argument
+            # Note: NVL is usually parsed as Coalesce or a function call by sqlglot
+            exp.Coalesce: "INHERITED",
+        }),
+        # Window functions - inferred from the inner function
+        window=_with_subclasses({
+            exp.Count: "BIGINT",
+            exp.Sum: "NUMERIC",
+            exp.Avg: "DOUBLE",
+            exp.RowNumber: "BIGINT",
+            exp.Rank: "BIGINT",
+            exp.DenseRank: "BIGINT",
+        }),
+        # _collect() buckets, named after the keys it returns
+        collect=_with_subclasses({
+            exp.Column: "columns",
+            exp.Table: "tables",
+            exp.CTE: "ctes",
+            exp.Join: "joins",
+            exp.Window: "windows",
+            **dict.fromkeys(agg_types, "aggregations"),
+            exp.Group: "group",
+            exp.Where: "where",
+            exp.Order: "order",
+        }),
+    )
+
+
 def classify_transformation(select_expr: exp.Expression) -> str:
     """Classify the type of transformation applied to a column."""
-    if isinstance(select_expr, exp.Column):
-        return "passthrough"
+    from sqlglot import exp
 
+    transform = _dispatch_tables().transform
     if isinstance(select_expr, exp.Alias):
-        inner = select_expr.this
-        if isinstance(inner, exp.Column):
-            return "renamed"
-        if isinstance(inner, (exp.Sum, exp.Avg, exp.Count, exp.Min, exp.Max)):
-            return "aggregated"
-        if isinstance(inner, exp.Window):
-            return "window_function"
-        return "derived"
-
-    if isinstance(select_expr, (exp.Sum, exp.Avg, exp.Count, exp.Min, exp.Max)):
-        return "aggregated"
+        kind = transform.get(type(select_expr.this), "derived")
+        return "renamed" if kind == "passthrough" else kind
 
-    if isinstance(select_expr, exp.Window):
-        return "window_function"
+    return transform.get(type(select_expr), "derived")
 
-    return "derived"
 
-
-def extract_aggregation_info(select_expr: exp.Expression) -> dict | None:
+def extract_aggregation_info(
+    select_expr: exp.Expression,
+    columns_index: dict[int, list[exp.Column]] | None = None,
+) -> dict | None:
     """
     Extract aggregation semantics from an expression.
 
     Returns a dict with aggregation details if the expression is aggregated, None otherwise.
     """
+    from sqlglot import exp
+
+    agg_types = _dispatch_tables().agg_types
     # Unwrap Alias
     expr = select_expr.this if isinstance(select_expr, exp.Alias) else select_expr
 
-    agg_funcs = {
-        exp.Sum: "SUM",
-        exp.Avg: "AVG",
-        exp.Count: "COUNT",
-        exp.Min: "MIN",
-        exp.Max: "MAX",
-    }
-
     # Check if the expression IS an aggregation function
-    for agg_type, agg_name in agg_funcs.items():
-        if isinstance(expr, agg_type):
-            # Extract what's being aggregated
-            agg_input = []
-            for col in expr.find_all(exp.Column):
-                agg_input.append(f"{col.table or ''}.{col.name}".lstrip("."))
-            return {
-                "function": agg_name,
-                "input_columns": agg_input if agg_input else ["*"] if agg_name == "COUNT" else [],
-            }
+    if isinstance(expr, agg_types):
+        return _describe_aggregation(expr, columns_index)
 
     # Check if expression CONTAINS aggregation functions (derived aggregation)
-    for agg_type, agg_name in agg_funcs.items():
-        found_aggs = list(expr.find_all(agg_type))
-        if found_aggs:
-            # Collect all aggregations in the expression
-            aggs = []
-            for agg in found_aggs:
-                agg_input = []
-                for col in agg.find_all(exp.Column):
-                    agg_input.append(f"{col.table or ''}.{col.name}".lstrip("."))
-                agg_func_name = agg_funcs.get(type(agg), "UNKNOWN")
-                aggs.append({
-                    "function": agg_func_name,
-                    "input_columns": agg_input if agg_input else ["*"] if agg_func_name == "COUNT" else [],
-                })
-            return {
-                "function": "DERIVED",
-                "contains": aggs,
-            }
+    found_aggs = [node for node in expr.walk() if isinstance(node, agg_types)]
+    if found_aggs:
+        return {
+            "function": "DERIVED",
+            "contains": [_describe_aggregation(agg, columns_index) for agg in found_aggs],
+        }
 
     return None
 
 
-def infer_data_type(select_expr: exp.Expression, schema: dict | None = None) -> str:
+def _describe_aggregation(
+    agg: exp.Expression,
+    columns_index: dict[int, list[exp.Column]] | None = None,
+) -> dict:
+    """Describe a single aggregate call: its function name and input columns."""
+    agg_input = []
+    for col in _columns_of(agg, columns_index):
+        agg_input.append(f"{col.table or ''}.{col.name}".lstrip("."))
+    agg_name = _dispatch_tables().agg_names[type(agg)]
+    return {
+        "function": agg_name,
+        "input_columns": agg_input if agg_input else ["*"] if agg_name == "COUNT" else [],
+    }
+
+
+def build_schema_type_index(schema: dict | None) -> dict[tuple[str, str], str]:
+    """
+    Index schema column types by (lowercased table, column) for infer_data_type.
+
+    A ("", column) entry holds the first table's type for unqualified columns.
+    Earlier tables win, matching a scan of the schema in order.
+    """
+    index: dict[tuple[str, str], str] = {}
+    for tbl_name, columns in (schema or {}).items():
+        tbl_lower = tbl_name.lower()
+        for col_name, col_type in columns.items():
+            col_type = str(col_type).upper()
+            index.setdefault((tbl_lower, col_name), col_type)
+            index.setdefault(("", col_name), col_type)
+    return index
+
+
+def infer_data_type(
+    select_expr: exp.Expression,
+    schema: dict | None = None,
+    schema_index: dict[tuple[str, str], str] | None = None,
+) -> str:
     """
     Infer the data type of an expression.
 
+    Pass a prebuilt `schema_index` when inferring many columns against one schema.
     Returns a string describing the inferred type.
     """
+    from sqlglot import exp
+
+    tables = _dispatch_tables()
     # Unwrap Alias to get the actual expression
     expr = select_expr.this if isinstance(select_expr, exp.Alias) else select_expr
 
+    inferred = tables.infer.get(type(expr))
+    if inferred:
+        return inferred
+
     # Check for CAST - explicit type conversion
     if isinstance(expr, exp.Cast):
         if expr.to and hasattr(expr.to, 'this'):
             return str(expr.to.this).upper()
         return "UNKNOWN"
 
-    # Aggregation functions have known return types
-    if isinstance(expr, exp.Count):
-        return "BIGINT"
-    if isinstance(expr, exp.Sum):
-        return "NUMERIC"
-    if isinstance(expr, exp.Avg):
-        return "DOUBLE"
-    if isinstance(expr, (exp.Min, exp.Max)):
-        return "INHERITED"  # Same type as input
-
-    # Window functions - try to infer from the inner function
     if isinstance(expr, exp.Window):
-        inner_func = expr.this
-        if isinstance(inner_func, exp.Count):
-            return "BIGINT"
-        if isinstance(inner_func, exp.Sum):
-            return "NUMERIC"
-        if isinstance(inner_func, exp.Avg):
-            return "DOUBLE"
-        if isinstance(inner_func, (exp.RowNumber, exp.Rank, exp.DenseRank)):
-            return "BIGINT"
-        return "INHERITED"
-
-    # Boolean expressions
-    if isinstance(expr, (exp.EQ, exp.NEQ, exp.GT, exp.GTE, exp.LT, exp.LTE,
-                         exp.And, exp.Or, exp.Not, exp.In, exp.Between,
-                         exp.Is, exp.Like)):
-        return "BOOLEAN"
-
-    # String functions
-    if isinstance(expr, (exp.Concat, exp.Substring, exp.Upper, exp.Lower,
-                         exp.Trim, exp.Replace)):
-        return "VARCHAR"
-
-    # Date/time functions
-    if isinstance(expr, (exp.CurrentDate, exp.CurrentTimestamp)):
-        return "TIMESTAMP"
-    if isinstance(expr, exp.DateTrunc):
-        return "TIMESTAMP"
-    if isinstance(expr, exp.Extract):
-        return "INTEGER"
-    if isinstance(expr, exp.DateDiff):
-        return "INTEGER"
-
-    # Arithmetic - preserve numeric type
-    if isinstance(expr, (exp.Add, exp.Sub, exp.Mul, exp.Div)):
-        return "NUMERIC"
+        return tables.window.get(type(expr.this), "INHERITED")
 
     # CASE expression - check THEN clauses for type hints
     if isinstance(expr, exp.Case):
@@ -213,13 +318,9 @@ def infer_data_type(select_expr: exp.Expression, schema: dict | None = None) ->
     # Simple column reference - try to get from schema
     if isinstance(expr, exp.Column):
         if schema:
-            table = expr.table or ""
-            col_name = expr.name
-            # Try to find in schema
-            for tbl_name, columns in schema.items():
-                if tbl_name.lower() == table.lower() or not table:
-                    if col_name in columns:
-                        return str(columns[col_name]).upper()
+            if schema_index is None:
+                schema_index = build_schema_type_index(schema)
+            return schema_index.get(((expr.table or "").lower(), expr.name), "UNKNOWN")
         return "UNKNOWN"
 
     # Literal values
@@ -231,11 +332,6 @@ def infer_data_type(select_expr: exp.Expression, schema: dict | None = None) ->
                 return "DECIMAL"
             return "INTEGER"
 
-    # Coalesce/NVL - inherit from first non-null argument
-    # Note: NVL is usually parsed as Coalesce or a function call by sqlglot
-    if isinstance(expr, exp.Coalesce):
-        return "INHERITED"
-
     return "UNKNOWN"
 
 
@@ -245,6 +341,8 @@ def build_alias_map(selects: list[exp.Expression]) -> dict[str, exp.Expression]:
 
     This enables resolution of self-referencing columns.
     """
+    from sqlglot import exp
+
     alias_map = {}
     for sel in selects:
         alias_name = sel.alias_or_name.lower()
@@ -255,44 +353,132 @@ def build_alias_map(selects: list[exp.Expression]) -> dict[str, exp.Expression]:
     return alias_map
 
 
+def _collect(ast: exp.Expression, projections: list[exp.Expression]) -> dict[str, Any]:
+    """
+    Walk the AST once and bucket the nodes analyze_select needs.
+
+    Uses BFS so every bucket keeps the order find_all() would produce, and the
+    first GROUP BY / WHERE / ORDER BY matches what find() returns. Columns
+    are indexed by id() of each enclosing projection (and its unwrapped Alias
+    body) and each enclosing aggregate, so per-column helpers can look them up
+    instead of walking the subtree again.
+    """
+    from sqlglot import exp
+
+    kinds = _dispatch_tables().collect
+    buckets: dict[str, list[exp.Expression]] = {
+        "tables": [],
+        "ctes": [],
+        "joins": [],
+        "aggregations": [],
+        "windows": [],
+    }
+    columns: dict[int, list[exp.Column]] = {}
+    # First GROUP BY / WHERE / ORDER BY in walk order, as find() would return
+    firsts: dict[str, exp.Expression] = {}
+
+    owner_ids = set()
+    for sel in projections:
+        owner_ids.add(id(sel))
+        if isinstance(sel, exp.Alias):
+            owner_ids.add(id(sel.this))
+
+    # id(node) -> ids of the projections/aggregates enclosing it (inclusive)
+    enclosing: dict[int, tuple[int, ...]] = {}
+
+    for node in ast.walk():
+        key = id(node)
+        owners = enclosing.get(id(node.parent), ())
+        kind = kinds.get(type(node))
+
+        if kind == "aggregations" or key in owner_ids:
+            owners = owners + (key,)
+            columns[key] = []
+        if owners:
+            enclosing[key] = owners
+
+        if kind == "columns":
+            for owner in owners:
+                columns[owner].append(node)
+        elif kind in buckets:
+            buckets[kind].append(node)
+        elif kind is not None:
+            firsts.setdefault(kind, node)
+
+    return {
+        **buckets,
+        "columns": columns,
+        "group": firsts.get("group"),
+        "where": firsts.get("where"),
+        "order": firsts.get("order"),
+    }
+
+
+def _columns_of(expr: exp.Expression, columns_index: dict[int, list[exp.Column]] | None) -> Iterable[exp.Column]:
+    """Return the Column nodes under expr, from the _collect() index when available."""
+    from sqlglot import exp
+
+    if columns_index is not None:
+        cols = columns_index.get(id(expr))
+        if cols is not None:
+            return cols
+    return expr.find_all(exp.Column)
+
+
 def extract_source_columns(
     expr: exp.Expression,
     alias_map: dict[str, exp.Expression] | None = None,
-    _visited: set[str] | None = None,
+    columns_index: dict[int, list[exp.Column]] | None = None,
 ) -> list[dict]:
     """Extract all source column references from an expression."""
     sources = []
     alias_map = alias_map or {}
-    seen = set()
-    visited = _visited if _visited is not None else set()
-
-    for col in expr.find_all(exp.Column):
-        table = col.table or "unknown"
+    seen: set[tuple[str, str]] = set()
+    visited: set[str] = set()
+    # Stack of column iterators; a self-reference pushes the aliased
+    # expression's columns so they are emitted in place, depth-first
+    pending = [iter(_columns_of(expr, columns_index))]
+
+    while pending:
+        col = next(pending[-1], None)
+        if col is None:
+            pending.pop()
+            continue
+
+        table = sys.intern(col.table or "unknown")
         col_name = col.name.lower()
 
-        # Self-referencing resolution
+        # Self-referencing resolution; an alias already expanded (or one
+        # that names itself, e.g. "a AS a") is reported as-is
         if table == "unknown" and col_name in alias_map and col_name not in visited:
             visited.add(col_name)
-            # Recursively extract sources from the referenced alias
-            alias_sources = extract_source_columns(alias_map[col_name], alias_map, visited)
-            for src in alias_sources:
-                key = f"{src['table']}.{src['column']}"
-                if key not in seen:
-                    seen.add(key)
-                    sources.append(src)
-        else:
-            key = f"{table}.{col.name}"
-            if key not in seen:
-                seen.add(key)
-                sources.append({
-                    "table": table,
-                    "column": col.name,
-                })
+            pending.append(iter(_columns_of(alias_map[col_name], columns_index)))
+            continue
+
+        key = (table, sys.intern(col.name))
+        if key not in seen:
+            seen.add(key)
+            sources.append({
+                "table": key[0],
+                "column": key[1],
+            })
     return sources
 
 
+@functools.lru_cache(maxsize=16)
+def _get_generator(dialect: str | None) -> Generator:
+    """Return a shared Generator for dialect; Expression.sql() builds a new one per call."""
+    from sqlglot.dialects import Dialect
+
+    return Dialect.get_or_raise(dialect).generator()
+
+
 def analyze_select(ast: exp.Expression, dialect: str | None, schema: dict | None, max_expr_length: int | None = None) -> dict:
     """Analyze a SELECT statement."""
+    from sqlglot import exp
+    from sqlglot.errors import SqlglotError
+    from sqlglot.optimizer.qualify import qualify
+
     result = {
         "query_type": "SELECT",
         "dialect": dialect,
@@ -316,18 +502,39 @@ def analyze_select(ast: exp.Expression, dialect: str | None, schema: dict | None
     except SqlglotError:
         qualified = ast
 
-    # Extract tables
-    for table in qualified.find_all(exp.Table):
-        table_info = {
-            "name": table.name,
-            "alias": table.alias if table.alias else None,
-            "schema": table.db if table.db else None,
-        }
-        if table_info not in result["tables"]:
-            result["tables"].append(table_info)
+    # Render each node at most once; aggregates and windows often overlap the SELECT list.
+    # Keep the generator's copy: its dialect transforms rewrite the tree they are given,
+    # and type inference and source extraction still read these nodes afterwards.
+    rendered: dict[int, str] = {}
+    generate = _get_generator(dialect).generate
+
+    def render(node: exp.Expression) -> str:
+        key = id(node)
+        sql = rendered.get(key)
+        if sql is None:
+            sql = rendered[key] = generate(node)
+        return sql
+
+    selects = qualified.selects if hasattr(qualified, 'selects') else []
+    collected = _collect(qualified, selects)
+    schema_index = build_schema_type_index(schema) if schema else None
+    columns_index = collected["columns"]
+
+    # Extract tables, deduplicated on (name, alias, schema)
+    seen_tables = set()
+    for table in collected["tables"]:
+        key = (table.name, table.alias or None, table.db or None)
+        if key in seen_tables:
+            continue
+        seen_tables.add(key)
+        result["tables"].append({
+            "name": key[0],
+            "alias": key[1],
+            "schema": key[2],
+        })
 
     # Extract CTEs
-    for cte in qualified.find_all(exp.CTE):
+    for cte in collected["ctes"]:
         result["ctes"].append({
             "name": cte.alias,
             "columns": [col.alias_or_name for col in cte.this.selects] if hasattr(cte.this, 'selects') else [],
@@ -335,26 +542,26 @@ def analyze_select(ast: exp.Expression, dialect: str | None, schema: dict | None
 
     # Extract GROUP BY early so we can attach to aggregated columns
     group_by_cols = []
-    group = qualified.find(exp.Group)
+    group = collected["group"]
     if group:
         for expr in group.expressions:
-            group_by_cols.append(expr.sql(dialect=dialect))
+            group_by_cols.append(render(expr))
 
     # Analyze SELECT columns
     if hasattr(qualified, 'selects'):
-        alias_map = build_alias_map(qualified.selects)
-        for i, select_expr in enumerate(qualified.selects):
+        alias_map = build_alias_map(selects)
+        for i, select_expr in enumerate(selects):
             col_info = {
                 "output_position": i + 1,
                 "output_name": select_expr.alias_or_name,
-                "expression": truncate_expr(select_expr.sql(dialect=dialect), max_expr_length),
+                "expression": truncate_expr(render(select_expr), max_expr_length),
                 "transformation": classify_transformation(select_expr),
-                "data_type": infer_data_type(select_expr, schema),
-                "sources": extract_source_columns(select_expr, alias_map),
+                "data_type": infer_data_type(select_expr, schema, schema_index),
+                "sources": extract_source_columns(select_expr, alias_map, columns_index),
             }
 
             # Add aggregation semantics if applicable
-            agg_info = extract_aggregation_info(select_expr)
+            agg_info = extract_aggregation_info(select_expr, columns_index)
             if agg_info:
                 col_info["aggregation"] = agg_info
                 # Attach GROUP BY context for aggregated columns
@@ -364,7 +571,7 @@ def analyze_select(ast: exp.Expression, dialect: str | None, schema: dict | None
             result["columns"].append(col_info)
 
     # Extract JOINs
-    for join in qualified.find_all(exp.Join):
+    for join in collected["joins"]:
         side = join.side
         kind = join.kind
 
@@ -381,31 +588,46 @@ def analyze_select(ast: exp.Expression, dialect: str | None, schema: dict | None
         join_info = {
             "type": join_type,
             "table": join.this.name if isinstance(join.this, exp.Table) else str(join.this),
-            "condition": join.args.get("on").sql(dialect=dialect) if join.args.get("on") else None,
+            "condition": render(join.args["on"]) if join.args.get("on") else None,
         }
         result["joins"].append(join_info)
 
     # Extract WHERE filters
-    where = qualified.find(exp.Where)
+    where = collected["where"]
     if where:
-        result["filters"].append(where.this.sql(dialect=dialect))
+        result["filters"].append(render(where.this))
 
     # Add GROUP BY to result (already extracted above)
     result["group_by"] = group_by_cols
 
     # Extract ORDER BY
-    order = qualified.find(exp.Order)
+    order = collected["order"]
     if order:
         for expr in order.expressions:
-            result["order_by"].append(expr.sql(dialect=dialect))
+            result["order_by"].append(render(expr))
 
     # Identify aggregations and window functions
-    for agg in qualified.find_all((exp.Sum, exp.Avg, exp.Count, exp.Min, exp.Max)):
-        result["aggregations"].append(agg.sql(dialect=dialect))
+    for agg in collected["aggregations"]:
+        result["aggregations"].append(render(agg))
+
+    for win in collected["windows"]:
+        result["window_functions"].append(render(win))
+
+    return result
+
 
-    for win in qualified.find_all(exp.Window):
-        result["window_functions"].append(win.sql(dialect=dialect))
+def sources_as_pairs(result: dict[str, Any]) -> dict[str, Any]:
+    """
+    Replace each column's "sources" dicts with compact [table, column] pairs.
 
+    The pairs go under "table_col_pairs", in the same position and order.
+    """
+    for i, col in enumerate(result.get("columns", [])):
+        result["columns"][i] = {
+            ("table_col_pairs" if key == "sources" else key):
+                ([[src["table"], src["column"]] for src in value] if key == "sources" else value)
+            for key, value in col.items()
+        }
     return result
 
 
@@ -414,14 +636,22 @@ def analyze_query(
     dialect: str | None = None,
     schema: dict | None = None,
     max_expr_length: int | None = None,
+    ast: exp.Expression | None = None,
 ) -> dict[str, Any]:
     """
     Perform full analysis of a SQL query.
 
+    Pass a pre-parsed `ast` to skip parsing; note that analysis qualifies it in place.
+
     Returns comprehensive information about tables, columns, joins, and transformations.
     """
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import SqlglotError
+
     try:
-        ast = sqlglot.parse_one(sql, dialect=dialect)
+        if ast is None:
+            ast = sqlglot.parse_one(sql, dialect=dialect)
 
         if isinstance(ast, exp.Select):
             return {"success": True, **analyze_select(ast, dialect, schema, max_expr_length)}
@@ -459,7 +689,7 @@ def analyze_query(
             return {
                 "success": True,
                 "query_type": type(ast).__name__.upper(),
-                "sql": ast.sql(dialect=dialect),
+                "sql": _get_generator(dialect).generate(ast),
             }
 
     except SqlglotError as e:
@@ -470,65 +700,319 @@ def analyze_query(
         }
 
 
+# Bump when the analysis output changes shape so stale cache entries are ignored
+CACHE_VERSION = 3
+
+
+def default_cache_dir() -> Path:
+    """Return the on-disk result cache directory (honours XDG_CACHE_HOME)."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join("~", ".cache")
+    return Path(base).expanduser() / "sql-lineage" / "analyze"
+
+
+@functools.cache
+def _sqlglot_version() -> str:
+    """
+    Return the installed sqlglot version without importing sqlglot if possible.
+
+    Reads the package's generated _version.py so cache hits skip the import.
+    """
+    if "sqlglot" not in sys.modules:
+        spec = importlib.util.find_spec("sqlglot")
+        for location in (spec.submodule_search_locations or []) if spec else []:
+            version_spec = importlib.util.spec_from_file_location(
+                "_sqlglot_version", os.path.join(location, "_version.py")
+            )
+            try:
+                module = importlib.util.module_from_spec(version_spec)
+                version_spec.loader.exec_module(module)
+                return module.__version__
+            except (OSError, AttributeError):
+                break
+
+    import sqlglot
+
+    return sqlglot.__version__
+
+
+def cache_key(
+    sql: str,
+    dialect: str | None = None,
+    schema: dict | None = None,
+    max_expr_length: int | None = None,
+) -> str:
+    """Hash everything that affects analyze_query output into a stable cache key."""
+    payload = "|".join([
+        str(CACHE_VERSION),
+        _sqlglot_version(),
+        sql,
+        dialect or "",
+        json.dumps(schema, sort_keys=True),
+        str(max_expr_length),
+    ])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# In-process LRU of serialized results, keyed on cache_key()
+_MEMORY_CACHE_SIZE = 256
+
+# Larger queries bypass both cache layers; their result blobs would dominate
+# the in-process LRU and the disk store
+MAX_CACHED_SQL_LENGTH = 256 * 1024
+_memory_cache: OrderedDict[str, str] = OrderedDict()
+
+
+def analyze_query_cached(
+    sql: str,
+    dialect: str | None = None,
+    schema: dict | None = None,
+    max_expr_length: int | None = None,
+    cache_dir: Path | str | None = None,
+    ast: exp.Expression | None = None,
+) -> dict[str, Any]:
+    """
+    analyze_query() memoized in-process and, when cache_dir is set, on disk.
+
+    `ast` is only used on a cache miss. Every call returns a fresh dict, so
+    callers may mutate the result. SQL longer than MAX_CACHED_SQL_LENGTH is
+    analyzed directly and never cached.
+    """
+    if len(sql) > MAX_CACHED_SQL_LENGTH:
+        return analyze_query(sql, dialect, schema, max_expr_length, ast=ast)
+
+    key = cache_key(sql, dialect, schema, max_expr_length)
+
+    blob = _memory_cache.get(key)
+    if blob is not None:
+        _memory_cache.move_to_end(key)
+        return _loads(blob)
+
+    path = Path(cache_dir) / f"{key}.json" if cache_dir else None
+    if path is not None:
+        # A truncated or corrupt entry is a miss; it is recomputed and overwritten below
+        try:
+            blob = path.read_text(encoding="utf-8")
+            result = _loads(blob)
+        except (OSError, ValueError):
+            blob = None
+
+    if blob is None:
+        result = analyze_query(sql, dialect, schema, max_expr_length, ast=ast)
+        blob = orjson.dumps(result).decode() if orjson is not None else json.dumps(result)
+        if path is not None:
+            # Cache writes are best-effort; an unwritable cache dir must not fail analysis
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(f".{os.getpid()}.tmp")
+                tmp.write_text(blob, encoding="utf-8")
+                os.replace(tmp, path)
+            except OSError:
+                pass
+        # Round-trip so a fresh result matches what later cache hits return
+        result = _loads(blob)
+
+    _memory_cache[key] = blob
+    if len(_memory_cache) > _MEMORY_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+    return result
+
+
+def load_batch_manifest(
+    manifest: str,
+    dialect: str | None = None,
+    schema: dict | None = None,
+) -> list[dict]:
+    """
+    Load a batch manifest: a JSON list (string or @filepath) of queries.
+
+    Entries are SQL strings (or @filepaths), or objects with "sql" and optional
+    "id", "dialect" and "schema" keys overriding the command-line defaults.
+    """
+    try:
+        entries = _loads(read_input(manifest))
+    except json.JSONDecodeError as e:  # orjson.JSONDecodeError subclasses it
+        sys.exit(f"Error: Invalid batch manifest: {e}")
+    if not isinstance(entries, list):
+        sys.exit("Error: Batch manifest must be a JSON list")
+
+    jobs = []
+    for position, entry in enumerate(entries):
+        if isinstance(entry, str):
+            entry = {"sql": entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get("sql"), str):
+            sys.exit(f"Error: Batch entry {position} needs a \"sql\" string")
+        jobs.append({
+            "id": entry.get("id", position),
+            "sql": read_input(entry["sql"]),
+            "dialect": entry.get("dialect", dialect),
+            "schema": entry.get("schema", schema),
+        })
+    return jobs
+
+
+def _analyze_batch_entry(task: tuple[dict, int | None, str | None]) -> dict:
+    """Worker body for analyze_batch; module-level so process pools can pickle it."""
+    entry, max_expr_length, cache_dir = task
+    # One bad entry (unknown dialect, malformed schema) must not abort the whole batch
+    try:
+        if cache_dir is None:
+            result = analyze_query(entry["sql"], entry["dialect"], entry["schema"], max_expr_length)
+        else:
+            result = analyze_query_cached(
+                entry["sql"], entry["dialect"], entry["schema"], max_expr_length, cache_dir=cache_dir
+            )
+    except Exception as e:
+        result = {"success": False, "error": str(e)}
+    return {"id": entry["id"], **result}
+
+
+def analyze_batch(
+    entries: list[dict],
+    jobs: int | None = None,
+    max_expr_length: int | None = None,
+    cache_dir: str | Path | None = None,
+) -> Iterable[dict]:
+    """
+    Analyze manifest entries across worker processes, yielding results in manifest order.
+
+    Workers stay alive for the whole batch, so the sqlglot import and its
+    module setup are paid once per worker instead of once per query.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    tasks = [(entry, max_expr_length, cache_dir) for entry in entries]
+    if jobs == 1 or len(tasks) <= 1:
+        yield from map(_analyze_batch_entry, tasks)
+        return
+
+    # Hand each worker a few tasks per round trip so IPC doesn't dominate
+    # large manifests of small queries, while keeping enough chunks to balance
+    workers = jobs or os.cpu_count() or 1
+    chunksize = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        yield from pool.map(_analyze_batch_entry, tasks, chunksize=chunksize)
+
+
+def serve(
+    requests: TextIO,
+    responses: TextIO,
+    dialect: str | None = None,
+    schema: dict | None = None,
+    max_expr_length: int | None = None,
+    cache_dir: str | Path | None = None,
+    sources_soa: bool = False,
+) -> None:
+    """
+    Answer JSON Lines requests until EOF, one flushed result line per request.
+
+    Requests use the batch entry shape (a SQL string, or an object with "sql"
+    and optional "id", "dialect" and "schema"), but "sql" is always query text.
+    A request that fails gets an error line and the loop keeps serving.
+    Keeping one process alive spares callers that shell out per query the
+    interpreter start-up and sqlglot import on every call.
+    """
+    for position, line in enumerate(requests):
+        if not line.strip():
+            continue
+        try:
+            entry = _loads(line)
+        except ValueError:
+            entry = None
+        if isinstance(entry, str):
+            entry = {"sql": entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get("sql"), str):
+            result = {"id": position, "success": False, "error": 'Request needs a "sql" string'}
+        else:
+            task = {
+                "id": entry.get("id", position),
+                "sql": entry["sql"],
+                "dialect": entry.get("dialect", dialect),
+                "schema": entry.get("schema", schema),
+            }
+            result = _analyze_batch_entry((task, max_expr_length, cache_dir))
+            if sources_soa:
+                result = sources_as_pairs(result)
+        responses.write(json.dumps(result) + "\n")
+        responses.flush()
+
+
 def build_cte_dependencies(ast: exp.Expression) -> dict:
     """
     Build a map of CTE dependencies.
     
-    Returns: {cte_name: [list of CTEs/tables it references]}
+    Returns: {cte_name: [list of CTEs/tables it references]}, each list in
+    first-reference order. The walk is depth-first, so that is the order the
+    tables first appear in the query text.
     """
-    dependencies = {}
-    
-    for cte in ast.find_all(exp.CTE):
-        cte_name = cte.alias
-        refs = []
-        for table in cte.this.find_all(exp.Table):
-            table_name = table.name
+    from sqlglot import exp
+
+    # Dicts as insertion-ordered sets keep the output stable across runs
+    refs: dict[str, dict[str, None]] = {}
+    # id(node) -> names of the CTEs whose body contains it
+    enclosing: dict[int, tuple[str, ...]] = {}
+
+    for node in ast.walk(bfs=False):
+        owners = enclosing.get(id(node.parent), ())
+        if isinstance(node, exp.CTE):
+            refs.setdefault(node.alias, {})
+            owners += (node.alias,)
+        elif isinstance(node, exp.Table) and owners:
+            table_name = node.name
             if table_name:
-                refs.append(table_name)
-        dependencies[cte_name] = list(set(refs))
+                for cte_name in owners:
+                    refs[cte_name][table_name] = None
+        if owners:
+            enclosing[id(node)] = owners
     
-    return dependencies
+    return {cte_name: list(tables) for cte_name, tables in refs.items()}
+
+
+# Mermaid node ids cannot contain dashes or spaces
+_MERMAID_SAFE = str.maketrans({"-": "_", " ": "_"})
 
 
 def format_as_diagram(result: dict, dependencies: dict) -> str:
     """Format CTE dependencies as a Mermaid flowchart."""
-    lines = ["```mermaid", "flowchart TD"]
+    buf = io.StringIO()
+    w = buf.write
+    w("```mermaid\nflowchart TD\n")
     
     if not dependencies:
-        lines.append("    no_ctes[No CTEs found]")
+        w("    no_ctes[No CTEs found]\n")
     else:
         # Collect all nodes (CTEs and tables they reference)
-        cte_names = set(dependencies.keys())
-        cte_names_lower = {name.lower() for name in cte_names}
+        cte_names_lower = {name.lower() for name in dependencies}
         
-        all_tables = set()
+        all_tables = {}
         for refs in dependencies.values():
-            all_tables.update(refs)
+            all_tables.update(dict.fromkeys(refs))
         
         # Base tables: referenced tables that are not CTEs (case-insensitive check)
-        base_tables = {t for t in all_tables if t.lower() not in cte_names_lower}
+        base_tables = [t for t in all_tables if t.lower() not in cte_names_lower]
         
         # Add edges
         for cte_name, refs in dependencies.items():
-            safe_cte = cte_name.replace("-", "_").replace(" ", "_")
-            for ref in refs:
-                safe_ref = ref.replace("-", "_").replace(" ", "_")
-                lines.append(f"    {safe_ref} --> {safe_cte}")
+            safe_cte = cte_name.translate(_MERMAID_SAFE)
+            w("".join(
+                f"    {ref.translate(_MERMAID_SAFE)} --> {safe_cte}\n" for ref in refs
+            ))
         
         # Style base tables differently
         if base_tables:
-            lines.append(f"    classDef baseTable fill:#2d5a2d,stroke:#4a4a4a,color:#ffffff")
-            for bt in base_tables:
-                safe_bt = bt.replace("-", "_").replace(" ", "_")
-                lines.append(f"    class {safe_bt} baseTable")
+            w("    classDef baseTable fill:#2d5a2d,stroke:#4a4a4a,color:#ffffff\n")
+            w("".join(
+                f"    class {bt.translate(_MERMAID_SAFE)} baseTable\n" for bt in base_tables
+            ))
     
-    lines.append("```")
-    return "\n".join(lines)
+    w("```")
+    return buf.getvalue()
 
 
 def format_as_summary(result: dict, dependencies: dict) -> str:
     """Format as a concise summary showing table-to-table dependencies."""
-    lines = ["# SQL Summary\n"]
+    buf = io.StringIO()
+    w = buf.write
+    w("# SQL Summary\n\n")
     
     # Source tables (base tables, not CTEs)
     cte_names = {cte["name"].lower() for cte in result.get("ctes", [])}
@@ -538,75 +1022,89 @@ def format_as_summary(result: dict, dependencies: dict) -> str:
             source_tables.add(t["name"])
     
     if source_tables:
-        lines.append("## Source Tables\n")
-        for t in sorted(source_tables):
-            lines.append(f"- {t}")
-        lines.append("")
+        w("## Source Tables\n\n")
+        w("".join(f"- {t}\n" for t in sorted(source_tables)))
+        w("\n")
     
     # CTE chain
     if result.get("ctes"):
-        lines.append("## CTE Chain\n")
+        w("## CTE Chain\n\n")
         for cte in result["ctes"]:
             refs = dependencies.get(cte["name"], [])
             if refs:
-                lines.append(f"- **{cte['name']}** ← {', '.join(refs)}")
+                w(f"- **{cte['name']}** ← {', '.join(refs)}\n")
             else:
-                lines.append(f"- **{cte['name']}**")
-        lines.append("")
+                w(f"- **{cte['name']}**\n")
+        w("\n")
     
     # Final output
     if result.get("columns"):
-        lines.append(f"## Output ({len(result['columns'])} columns)\n")
-        col_names = [c["output_name"] for c in result["columns"][:10]]
-        lines.append(", ".join(col_names))
+        w(f"## Output ({len(result['columns'])} columns)\n\n")
+        w(", ".join(c["output_name"] for c in result["columns"][:10]))
+        w("\n")
         if len(result["columns"]) > 10:
-            lines.append(f"... (+{len(result['columns']) - 10} more)")
-        lines.append("")
+            w(f"... (+{len(result['columns']) - 10} more)\n")
+        w("\n")
     
-    return "\n".join(lines)
+    # Sections end with a newline; drop the last one since print() adds its own
+    return buf.getvalue()[:-1]
 
 
 def format_as_markdown(result: dict) -> str:
     """Format the analysis result as Markdown."""
-    lines = [f"# SQL Analysis\n"]
-    lines.append(f"**Query Type:** {result.get('query_type', 'Unknown')}\n")
+    buf = io.StringIO()
+    w = buf.write
+    w("# SQL Analysis\n\n")
+    w(f"**Query Type:** {result.get('query_type', 'Unknown')}\n\n")
 
     if result.get("tables"):
-        lines.append("## Tables\n")
-        for t in result["tables"]:
-            alias = f" (alias: {t['alias']})" if t.get("alias") else ""
-            lines.append(f"- `{t['name']}`{alias}")
-        lines.append("")
+        w("## Tables\n\n")
+        w("".join(
+            f"- `{t['name']}`" + (f" (alias: {t['alias']})\n" if t.get("alias") else "\n")
+            for t in result["tables"]
+        ))
+        w("\n")
 
     if result.get("ctes"):
-        lines.append("## CTEs (Common Table Expressions)\n")
-        for cte in result["ctes"]:
-            lines.append(f"- **{cte['name']}**: {', '.join(cte.get('columns', []))}")
-        lines.append("")
+        w("## CTEs (Common Table Expressions)\n\n")
+        w("".join(f"- **{cte['name']}**: {', '.join(cte.get('columns', []))}\n" for cte in result["ctes"]))
+        w("\n")
 
     if result.get("columns"):
-        lines.append("## Output Columns\n")
-        lines.append("| # | Name | Transformation | Sources | Expression |")
-        lines.append("|---|------|----------------|---------|------------|")
-        for col in result["columns"]:
-            sources = ", ".join(f"{s['table']}.{s['column']}" for s in col.get("sources", []))
-            expr = col.get("expression", "")[:50]
-            lines.append(f"| {col['output_position']} | {col['output_name']} | {col['transformation']} | {sources} | `{expr}` |")
-        lines.append("")
+        w("## Output Columns\n\n")
+        w("| # | Name | Transformation | Sources | Expression |\n")
+        w("|---|------|----------------|---------|------------|\n")
+        w("".join(
+            f"| {col['output_position']} | {col['output_name']} | {col['transformation']} | "
+            f"{', '.join([src['table'] + '.' + src['column'] for src in col.get('sources', ())])} | "
+            f"`{col.get('expression', '')[:50]}` |\n"
+            for col in result["columns"]
+        ))
+        w("\n")
 
     if result.get("joins"):
-        lines.append("## Joins\n")
-        for j in result["joins"]:
-            lines.append(f"- **{j['type']} JOIN** `{j['table']}` ON `{j.get('condition', 'N/A')}`")
-        lines.append("")
+        w("## Joins\n\n")
+        w("".join(f"- **{j['type']} JOIN** `{j['table']}` ON `{j.get('condition', 'N/A')}`\n" for j in result["joins"]))
+        w("\n")
 
     if result.get("filters"):
-        lines.append("## Filters (WHERE)\n")
-        for f in result["filters"]:
-            lines.append(f"- `{f}`")
-        lines.append("")
+        w("## Filters (WHERE)\n\n")
+        w("".join(f"- `{f}`\n" for f in result["filters"]))
+        w("\n")
 
-    return "\n".join(lines)
+    # Sections end with a newline; drop the last one since print() adds its own
+    return buf.getvalue()[:-1]
+
+
+def emit_output(path: str | None, write: Callable[[TextIO], Any]) -> None:
+    """Call write() on the --output file, or on stdout followed by a newline."""
+    if path:
+        with open(path, "w") as f:
+            write(f)
+        print(f"Analysis written to {path}")
+    else:
+        write(sys.stdout)
+        sys.stdout.write("\n")
 
 
 def main():
@@ -617,6 +1115,7 @@ def main():
 
     parser.add_argument(
         "sql",
+        nargs="?",
         help="SQL query string, or @filepath to read from file",
     )
     parser.add_argument(
@@ -646,53 +1145,128 @@ def main():
         default=None,
         help="Max characters for expression output (truncates with '...')",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the on-disk result cache (~/.cache/sql-lineage/analyze)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory for the on-disk result cache (default: ~/.cache/sql-lineage/analyze)",
+    )
+    parser.add_argument(
+        "--batch",
+        default=None,
+        help="JSON list of queries (string or @filepath) to analyze in parallel; emits JSON Lines",
+    )
+    parser.add_argument(
+        "--jobs", "-j",
+        type=int,
+        default=None,
+        help="Worker processes for --batch (default: CPU count)",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Stay running and answer JSON Lines requests from stdin, one result line each",
+    )
+    parser.add_argument(
+        "--sources-soa",
+        action="store_true",
+        help="Emit column sources as compact [table, column] pairs under 'table_col_pairs' (json only)",
+    )
 
     args = parser.parse_args()
-
-    sql = read_input(args.sql)
+    if args.sources_soa and args.format != "json":
+        sys.exit("Error: --sources-soa requires json output")
     schema = parse_schema(args.schema)
 
-    result = analyze_query(sql, args.dialect, schema, args.max_expr_length)
-    
-    # Handle parse errors early - show error clearly regardless of format
-    if not result.get("success"):
-        if args.format == "json":
-            output = json.dumps(result, indent=2)
-        else:
-            output = f"Error: {result.get('error')}\nHint: {result.get('hint', '')}"
-        
+    if args.serve:
+        if args.sql or args.batch:
+            sys.exit("Error: --serve reads queries from stdin; drop SQL and --batch")
+        if args.format != "json" or args.output:
+            sys.exit("Error: --serve supports only json output to stdout")
+        cache_dir = None if args.no_cache else (args.cache_dir or default_cache_dir())
+        serve(sys.stdin, sys.stdout, args.dialect, schema, args.max_expr_length,
+              cache_dir, args.sources_soa)
+        return
+
+    if args.batch:
+        if args.sql:
+            sys.exit("Error: Pass either SQL or --batch, not both")
+        if args.format != "json":
+            sys.exit("Error: --batch supports only json output")
+        if args.jobs is not None and args.jobs < 1:
+            sys.exit("Error: --jobs must be at least 1")
+        entries = load_batch_manifest(args.batch, args.dialect, schema)
+        cache_dir = None if args.no_cache else (args.cache_dir or default_cache_dir())
+        ok = True
+        out = open(args.output, "w") if args.output else sys.stdout
+        try:
+            for result in analyze_batch(entries, args.jobs, args.max_expr_length, cache_dir):
+                ok = ok and result.get("success", False)
+                if args.sources_soa:
+                    result = sources_as_pairs(result)
+                out.write(json.dumps(result) + "\n")
+        finally:
+            if args.output:
+                out.close()
         if args.output:
-            with open(args.output, "w") as f:
-                f.write(output)
             print(f"Analysis written to {args.output}")
-        else:
-            print(output)
-        sys.exit(1)
-    
-    # Build CTE dependencies for diagram/summary formats
+        sys.exit(0 if ok else 1)
+
+    if not args.sql:
+        sys.exit("Error: SQL is required unless using --batch or --serve")
+    sql = read_input(args.sql)
+
+    # Diagram/summary also need CTE dependencies: parse once and share the AST
+    ast = None
     cte_deps = {}
     if args.format in ("diagram", "summary"):
+        import sqlglot
+        from sqlglot.errors import SqlglotError
+
         try:
             ast = sqlglot.parse_one(sql, dialect=args.dialect)
+            # Read dependencies before analysis qualifies the AST in place
             cte_deps = build_cte_dependencies(ast)
         except SqlglotError:
-            pass
-
-    if args.format == "markdown":
-        output = format_as_markdown(result)
-    elif args.format == "diagram":
-        output = format_as_diagram(result, cte_deps)
-    elif args.format == "summary":
-        output = format_as_summary(result, cte_deps)
+            ast = None  # analyze_query reports the parse error
+
+    if args.format == "diagram" and ast is not None:
+        # The diagram is drawn from cte_deps alone, so skip qualify() and the
+        # column analysis; only a parse error needs analyze_query's report
+        result = {"success": True}
+    elif args.no_cache:
+        result = analyze_query(sql, args.dialect, schema, args.max_expr_length, ast=ast)
     else:
-        output = json.dumps(result, indent=2)
-
-    if args.output:
-        with open(args.output, "w") as f:
-            f.write(output)
-        print(f"Analysis written to {args.output}")
+        result = analyze_query_cached(
+            sql, args.dialect, schema, args.max_expr_length,
+            cache_dir=args.cache_dir or default_cache_dir(), ast=ast,
+        )
+    
+    # Handle parse errors early - show error clearly regardless of format
+    if not result.get("success"):
+        if args.format == "json":
+            emit_output(args.output, lambda fh: dump_indented(result, fh))
+        else:
+            output = f"Error: {result.get('error')}\nHint: {result.get('hint', '')}"
+            emit_output(args.output, lambda fh: fh.write(output))
+        sys.exit(1)
+    
+    if args.format == "json":
+        if args.sources_soa:
+            result = sources_as_pairs(result)
+        emit_output(args.output, lambda fh: dump_indented(result, fh))
     else:
-        print(output)
+        if args.format == "markdown":
+            output = format_as_markdown(result)
+        elif args.format == "diagram":
+            output = format_as_diagram(result, cte_deps)
+        else:
+            output = format_as_summary(result, cte_deps)
+        emit_output(args.output, lambda fh: fh.write(output))
 
     sys.exit(0 if result.get("success") else 1)
 
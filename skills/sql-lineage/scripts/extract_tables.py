@@ -15,6 +15,7 @@ Usage:
 import argparse
 import json
 import sys
+from pathlib import Path
 
 import sqlglot
 from sqlglot import exp
@@ -22,15 +23,14 @@ from sqlglot.errors import SqlglotError
 
 
 def read_input(value: str) -> str:
-    if value.startswith("@"):
-        try:
-            with open(value[1:], "r", encoding="utf-8") as f:
-                return f.read()
-        except FileNotFoundError:
-            sys.exit(f"Error: File not found: {value[1:]}")
-        except Exception as e:
-            sys.exit(f"Error reading file {value[1:]}: {e}")
-    return value
+    if value[:1] != "@":
+        return value
+    try:
+        return Path(value[1:]).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        sys.exit(f"Error: File not found: {value[1:]}")
+    except Exception as e:
+        sys.exit(f"Error reading file {value[1:]}: {e}")
 
 
 def extract_tables(sql: str, dialect: str | None = None) -> list[dict]:
@@ -38,20 +38,24 @@ def extract_tables(sql: str, dialect: str | None = None) -> list[dict]:
     try:
         ast = sqlglot.parse_one(sql, dialect=dialect)
         tables = []
+        seen = set()
 
         for table in ast.find_all(exp.Table):
+            key = (table.name, table.db or None, table.catalog or None, table.alias or None)
+            if key in seen:
+                continue
+            seen.add(key)
+
             table_info = {
                 "name": table.name,
-                "database": table.db if table.db else None,
-                "catalog": table.catalog if table.catalog else None,
-                "alias": table.alias if table.alias else None,
+                "database": key[1],
+                "catalog": key[2],
+                "alias": key[3],
             }
             # Construct fully qualified name
             parts = [p for p in [table.catalog, table.db, table.name] if p]
             table_info["qualified_name"] = ".".join(parts)
-            
-            if table_info not in tables:
-                tables.append(table_info)
+            tables.append(table_info)
 
         return {"success": True, "tables": tables}
 
@@ -59,6 +63,17 @@ def extract_tables(sql: str, dialect: str | None = None) -> list[dict]:
         return {"success": False, "error": str(e)}
 
 
+def extract_table_names(sql: str, dialect: str | None = None) -> dict:
+    """Extract distinct table names in first-seen order, skipping the per-table detail."""
+    try:
+        ast = sqlglot.parse_one(sql, dialect=dialect)
+    except SqlglotError as e:
+        return {"success": False, "error": str(e)}
+
+    names = dict.fromkeys(table.name for table in ast.find_all(exp.Table))
+    return {"success": True, "names": list(names)}
+
+
 def main():
     parser = argparse.ArgumentParser(description="Extract tables from SQL")
     parser.add_argument("sql", help="SQL query or @filepath")
@@ -67,11 +82,13 @@ def main():
 
     args = parser.parse_args()
     sql = read_input(args.sql)
-    result = extract_tables(sql, args.dialect)
+    if args.names_only:
+        result = extract_table_names(sql, args.dialect)
+    else:
+        result = extract_tables(sql, args.dialect)
 
     if args.names_only and result.get("success"):
-        names = list(set(t["name"] for t in result["tables"]))
-        print("\n".join(names))
+        print("\n".join(result["names"]))
     else:
         print(json.dumps(result, indent=2))
 
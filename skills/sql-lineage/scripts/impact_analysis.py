@@ -3,6 +3,7 @@
 # requires-python = ">=3.11"
 # dependencies = [
 #     "sqlglot[rs]>=26.0.0",
+#     "orjson>=3.9",
 # ]
 # ///
 """
@@ -17,16 +18,27 @@ Usage:
 """
 
 import argparse
+import bisect
+import functools
+import heapq
 import json
 import re
 import sys
-from typing import Any, Iterable
+from collections import deque
+from typing import Any, Iterable, NamedTuple, TextIO
 
 import sqlglot
 from sqlglot import exp
+from sqlglot.dialects.dialect import Dialect
 from sqlglot.errors import SqlglotError
+from sqlglot.generator import Generator
 from sqlglot.optimizer.qualify import qualify
 
+try:
+    import orjson
+except ImportError:  # optional speedup; stdlib json is the fallback
+    orjson = None
+
 
 def read_input(value: str) -> str:
     """Read from file if value starts with @, otherwise return as-is."""
@@ -41,6 +53,30 @@ def read_input(value: str) -> str:
     return value
 
 
+def dump_indented(obj: Any, fh: TextIO) -> None:
+    """Write 2-space indented JSON to fh, using orjson when it is installed."""
+    if orjson is not None:
+        out = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        # orjson emits raw UTF-8; keep stdlib's ASCII-escaped output for anything else
+        if out.isascii():
+            fh.write(out.decode())
+            return
+    # Stream chunks instead of building the whole document in memory
+    json.dump(obj, fh, indent=2)
+
+
+@functools.lru_cache(maxsize=16)
+def _get_dialect(dialect: str | None) -> Dialect:
+    """Resolve a dialect name once; sqlglot re-resolves string dialects on every call."""
+    return Dialect.get_or_raise(dialect)
+
+
+@functools.lru_cache(maxsize=16)
+def _get_generator(dialect: str | None) -> Generator:
+    """Return a shared Generator for dialect; Expression.sql() builds a new one per call."""
+    return _get_dialect(dialect).generator()
+
+
 def truncate_expr(expr: str | None, max_length: int | None) -> str | None:
     """Truncate expression to max_length if specified."""
     if expr is None or max_length is None or max_length <= 0:
@@ -50,6 +86,10 @@ def truncate_expr(expr: str | None, max_length: int | None) -> str | None:
     return expr[:max_length] + "..."
 
 
+# WITH/SELECT opening a line, either alone or followed by a space and more text
+_LINE_KEYWORD = re.compile(r'^[^\S\n]*(WITH|SELECT)(?:[^\S\n]*$|( ))', re.IGNORECASE | re.MULTILINE)
+
+
 def find_line_numbers(sql: str, cte_names: set[str]) -> dict[str, int]:
     """
     Find line numbers where CTEs and final SELECT are defined.
@@ -58,45 +98,48 @@ def find_line_numbers(sql: str, cte_names: set[str]) -> dict[str, int]:
     - "cte:<cte_name>" -> line number where CTE starts
     - "final_select" -> line number where final SELECT starts
     """
-    lines = sql.split('\n')
     line_info = {}
+    # Offsets of every newline; bisecting a match start gives its line number
+    newlines = [m.start() for m in re.finditer('\n', sql)]
+
+    # One scan for every CTE definition ("cte_name AS (" on a single line)
+    cte_hits: dict[int, list[str]] = {}
+    if cte_names:
+        by_lower = {name.lower(): name for name in cte_names}
+        pattern = re.compile(
+            r'\b(' + '|'.join(map(re.escape, cte_names)) + r')[^\S\n]+AS[^\S\n]*\(',
+            re.IGNORECASE,
+        )
+        for m in pattern.finditer(sql):
+            line_no = bisect.bisect_right(newlines, m.start()) + 1
+            cte_hits.setdefault(line_no, []).append(by_lower[m.group(1).lower()])
+
+    # Lines opening with WITH/SELECT; "spaced" means more text follows a space
+    keyword_lines: dict[int, tuple[str, bool]] = {}
+    for m in _LINE_KEYWORD.finditer(sql):
+        line_no = bisect.bisect_right(newlines, m.start()) + 1
+        keyword_lines[line_no] = (m.group(1).upper(), m.group(2) == ' ')
 
     # Track if we're inside a CTE block
     in_with_clause = False
 
-    for i, line in enumerate(lines, 1):
-        line_upper = line.upper().strip()
+    for i in sorted(cte_hits.keys() | keyword_lines.keys()):
+        keyword, spaced = keyword_lines.get(i, (None, False))
 
         # Detect start of WITH clause
-        if line_upper.startswith('WITH ') or line_upper == 'WITH':
+        if keyword == 'WITH':
             in_with_clause = True
 
-        # Look for CTE definitions: "cte_name AS (" or "cte_name AS"
-        for cte_name in cte_names:
-            # Pattern: cte_name followed by AS (case-insensitive)
-            pattern = rf'\b{re.escape(cte_name)}\s+AS\s*[\(\n]'
-            if re.search(pattern, line, re.IGNORECASE):
-                line_info[f"cte:{cte_name}"] = i
-                break
-
-        # Detect final SELECT (SELECT not inside WITH clause definition)
-        # This is the SELECT that comes after all CTEs
-        if "final_select" not in line_info:
-            # Look for SELECT that's not part of a CTE definition
-            # A final SELECT typically starts at column 0 or follows a closing paren
-            if line_upper.startswith('SELECT ') or line_upper == 'SELECT':
-                # Check if this is after the CTE definitions
-                # (heuristic: if we've found CTEs and this SELECT is at the start of line)
-                if not in_with_clause or (cte_names and len(line_info) >= len(cte_names)):
-                    line_info["final_select"] = i
-
-        # Detect end of WITH clause (when we hit the final SELECT)
-        if in_with_clause and line_upper.startswith('SELECT '):
-            # Check if all CTEs have been found
-            if len([k for k in line_info if k.startswith("cte:")]) >= len(cte_names):
-                in_with_clause = False
-                if "final_select" not in line_info:
-                    line_info["final_select"] = i
+        for cte_name in cte_hits.get(i, ()):
+            line_info[f"cte:{cte_name}"] = i
+
+        # Detect final SELECT: the first SELECT at the start of a line once
+        # we're outside the WITH clause or every CTE has been seen
+        if keyword == 'SELECT' and "final_select" not in line_info:
+            # Only CTE keys are in line_info until final_select is set
+            all_ctes_seen = len(line_info) >= len(cte_names)
+            if not in_with_clause or (all_ctes_seen and (cte_names or spaced)):
+                line_info["final_select"] = i
 
     return line_info
 
@@ -118,55 +161,139 @@ def extract_source_columns(
     alias_map: dict[str, exp.Expression] | None = None,
     alias_table_map: dict[str, str] | None = None,
     _visited: set[str] | None = None,
+    _memo: dict[tuple[str, frozenset[str]], tuple[frozenset[str], frozenset[str]]] | None = None,
+    _columns: dict[int, list[exp.Column]] | None = None,
 ) -> set[str]:
     """Extract all source columns from an expression, resolving self-references.
 
     alias_table_map lets us expand table aliases to their base table names so
     reverse-lineage can match both `o.status` and `orders.status`.
+
+    _memo caches alias expansions across calls that share both maps (one per
+    relation), so wide SELECTs reusing an alias expand it once. _columns maps
+    id(select item) to its Columns in find_all order (RelationIndex.columns_in)
+    to skip the per-expression walk.
     """
     sources = set()
     alias_map = alias_map or {}
     alias_table_map = alias_table_map or {}
     visited = _visited if _visited is not None else set()
+    memo = _memo if _memo is not None else {}
+    columns = _columns.get(id(expr)) if _columns is not None else None
+    if columns is None:
+        columns = expr.find_all(exp.Column)
 
-    for col in expr.find_all(exp.Column):
+    for col in columns:
         table = (col.table or "unknown").lower()
         col_name = col.name.lower()
 
         if table == "unknown" and col_name in alias_map and col_name not in visited:
-            visited.add(col_name)
-            alias_sources = extract_source_columns(
-                alias_map[col_name], alias_map, alias_table_map, visited
-            )
-            sources.update(alias_sources)
+            # An expansion depends on which aliases were already visited, and
+            # it marks more as visited, so key on the former and cache the latter
+            key = (col_name, frozenset(visited))
+            cached = memo.get(key)
+            if cached is None:
+                visited.add(col_name)
+                alias_sources = extract_source_columns(
+                    alias_map[col_name], alias_map, alias_table_map, visited, memo, _columns
+                )
+                cached = memo[key] = (frozenset(alias_sources), frozenset(visited - key[1]))
+            sources.update(cached[0])
+            visited.update(cached[1])
         else:
             # Always keep the alias-qualified reference
-            sources.add(f"{table}.{col_name}")
+            sources.add(sys.intern(f"{table}.{col_name}"))
 
             # Also add base-table-qualified reference when available
             base_table = alias_table_map.get(table)
             if base_table:
-                sources.add(f"{base_table}.{col_name}")
+                sources.add(sys.intern(f"{base_table}.{col_name}"))
 
     return sources
 
 
+class RelationIndex(NamedTuple):
+    """Tables, subqueries and columns under each relation or select item, plus every CTE, from one walk."""
+
+    tables_in: dict[int, list[exp.Table]]
+    subqueries_in: dict[int, list[exp.Subquery]]
+    columns_in: dict[int, list[exp.Column]]
+    ctes: list[exp.CTE]
+
+
+def index_relations(ast: exp.Expression) -> RelationIndex:
+    """
+    Index the Tables and Subqueries under every node that process_relation can
+    be handed (the root, CTE/subquery bodies and set operation branches).
+
+    One walk replaces a find_all per relation; lists keep BFS order, which
+    matches find_all order within each subtree.
+    """
+    tables_in: dict[int, list[exp.Table]] = {}
+    subqueries_in: dict[int, list[exp.Subquery]] = {}
+    columns_in: dict[int, list[exp.Column]] = {}
+    ctes: list[exp.CTE] = []
+    # id(node) -> ids of the relations whose subtree contains it
+    enclosing: dict[int, tuple[int, ...]] = {}
+    # id(node) -> ids of the select items (and aliased item bodies) containing it
+    enclosing_items: dict[int, tuple[int, ...]] = {}
+
+    for node in ast.walk():
+        parent = node.parent
+        owners = enclosing.get(id(parent), ())
+        if (
+            node is ast
+            or (node.arg_key == "this" and isinstance(parent, (exp.CTE, exp.Subquery)))
+            or (node.arg_key in ("this", "expression") and isinstance(parent, exp.SetOperation))
+        ):
+            owners += (id(node),)
+        enclosing[id(node)] = owners
+
+        # Select items, and the body of an aliased item, which is what the
+        # alias map hands back to extract_source_columns
+        items = enclosing_items.get(id(parent), ())
+        if (node.arg_key == "expressions" and isinstance(parent, exp.Select)) or (
+            node.arg_key == "this" and isinstance(parent, exp.Alias) and items[-1:] == (id(parent),)
+        ):
+            items += (id(node),)
+            columns_in[id(node)] = []
+        enclosing_items[id(node)] = items
+
+        if isinstance(node, exp.Column):
+            for item in items:
+                columns_in[item].append(node)
+        elif isinstance(node, exp.Table):
+            for owner in owners:
+                tables_in.setdefault(owner, []).append(node)
+        elif isinstance(node, exp.Subquery):
+            for owner in owners:
+                subqueries_in.setdefault(owner, []).append(node)
+        elif isinstance(node, exp.CTE):
+            ctes.append(node)
+
+    return RelationIndex(tables_in, subqueries_in, columns_in, ctes)
+
+
 def build_dependency_graph(
     ast: exp.Expression,
-    max_expr_length: int | None = None,
-    dialect: str | None = None,
+    relations: RelationIndex | None = None,
 ) -> dict[str, dict]:
     """
     Build a dependency graph for all columns in the query.
 
+    Pass relations when the caller already has index_relations(ast), e.g. to
+    reuse its CTE list.
+
     Returns a dict where:
     - Keys are column identifiers (e.g., "cte_name.column_name" or "output.column_name")
     - Values are dicts with:
-        - "sources": set of source column identifiers this column depends on
+        - "sources": frozenset of source column identifiers this column depends on
         - "location": where this column is defined ("cte", "output", "subquery")
-        - "expression": the SQL expression
+        - "node": the select expression, rendered only for impacted columns
     """
     graph = {}
+    # Passthrough columns often share a source set; keep one object per distinct set
+    source_pool: dict[frozenset[str], frozenset[str]] = {}
     processed_subqueries: set[int] = set()
     subquery_counter = 0
 
@@ -175,9 +302,11 @@ def build_dependency_graph(
         subquery_counter += 1
         return f"subq{subquery_counter}"
 
+    tables_in, subqueries_in, columns_in, ctes = relations or index_relations(ast)
+
     def collect_table_aliases(relation: exp.Expression, subquery_aliases: dict[str, str]) -> dict[str, str]:
         mapping: dict[str, str] = {}
-        for table in relation.find_all(exp.Table):
+        for table in tables_in.get(id(relation), ()):
             alias = (table.alias or table.name or "").lower()
             base = (table.name or "").lower()
             if alias:
@@ -198,7 +327,7 @@ def build_dependency_graph(
 
         # Discover inline subqueries in this relation (FROM / JOIN, etc.)
         subquery_aliases: dict[str, str] = {}
-        for sub in relation.find_all(exp.Subquery):
+        for sub in subqueries_in.get(id(relation), ()):
             sub_id = id(sub)
             if sub_id in processed_subqueries:
                 continue
@@ -212,22 +341,26 @@ def build_dependency_graph(
 
         alias_map = build_alias_map(relation.selects)
         alias_table_map = collect_table_aliases(relation, subquery_aliases)
+        memo: dict = {}
 
         for i, sel in enumerate(relation.selects):
             col_name = sel.alias_or_name.lower()
-            col_id = f"{name}.{col_name}"
-            sources = extract_source_columns(sel, alias_map, alias_table_map)
+            col_id = sys.intern(f"{name}.{col_name}")
+            sources = frozenset(extract_source_columns(
+                sel, alias_map, alias_table_map, _memo=memo, _columns=columns_in
+            ))
+            sources = source_pool.setdefault(sources, sources)
             graph[col_id] = {
                 "sources": sources,
                 "location": location,
                 "cte_name": name if location in {"cte", "subquery"} else None,
                 "output_position": i + 1 if location == "output" else None,
                 "column_name": col_name,
-                "expression": truncate_expr(sel.sql(dialect=dialect), max_expr_length),
+                "node": sel,
             }
 
     # Process CTEs
-    for cte in ast.find_all(exp.CTE):
+    for cte in ctes:
         cte_name = cte.alias.lower()
         process_relation(cte.this, "cte", cte_name)
 
@@ -245,9 +378,7 @@ def build_reverse_index(graph: dict[str, dict]) -> dict[str, set[str]]:
 
     for col_id, info in graph.items():
         for source in info["sources"]:
-            if source not in reverse_index:
-                reverse_index[source] = set()
-            reverse_index[source].add(col_id)
+            reverse_index.setdefault(source, set()).add(col_id)
 
     return reverse_index
 
@@ -257,36 +388,54 @@ def find_impacted_columns(
     graph: dict[str, dict],
     reverse_index: dict[str, set[str]],
     derived_names: set[str],
+    dialect: str | None = None,
+    max_expr_length: int | None = None,
+    summary_only: bool = False,
+    sources_by_column: dict[str, list[str]] | None = None,
 ) -> dict[str, Any]:
     """
     Find all columns impacted by a change to source_column.
 
-    Uses BFS to find transitive dependencies.
+    Uses BFS to find transitive dependencies. Expressions are rendered only
+    for the impacted columns, and not at all when summary_only is set.
+    sources_by_column (from ImpactIndex) answers unqualified lookups without
+    scanning the reverse index.
     """
     source_lower = source_column.lower()
 
     # Normalize source column (handle table.column or just column)
     if "." not in source_lower:
         # If no table specified, search for any column with this name
-        matching_sources = [s for s in reverse_index.keys() if s.endswith(f".{source_lower}")]
+        if sources_by_column is not None:
+            matching_sources = sources_by_column.get(source_lower, [])
+        else:
+            matching_sources = [s for s in reverse_index.keys() if s.endswith(f".{source_lower}")]
         if not matching_sources:
             return {
                 "success": False,
                 "error": f"Source column '{source_column}' not found in query",
-                "available_sources": sorted(list(reverse_index.keys()))[:20],
+                "available_sources": heapq.nsmallest(20, reverse_index),
             }
         # Use all matching sources
         sources_to_check = set(matching_sources)
     else:
         sources_to_check = {source_lower}
 
-    # BFS to find all impacted columns
+    generate = _get_generator(dialect).generate
+
+    def render(info: dict) -> str | None:
+        node = info.get("node")
+        return None if node is None else truncate_expr(generate(node), max_expr_length)
+
+    # BFS to find all impacted columns, categorizing each one when first reached
     impacted = set()
+    impacted_output = []
+    impacted_ctes = []
     visited = set()
-    queue = list(sources_to_check)
+    queue = deque(sources_to_check)
 
     while queue:
-        current = queue.pop(0)
+        current = queue.popleft()
         if current in visited:
             continue
         visited.add(current)
@@ -294,7 +443,26 @@ def find_impacted_columns(
         # Find direct dependents
         dependents = reverse_index.get(current, set())
         for dep in dependents:
-            impacted.add(dep)
+            if dep not in impacted:
+                impacted.add(dep)
+                info = graph.get(dep, {})
+                location = info.get("location")
+                if location == "output":
+                    entry = {
+                        "column": info.get("column_name"),
+                        "position": info.get("output_position"),
+                    }
+                    impacted_output.append(entry)
+                elif location == "cte":
+                    entry = {
+                        "cte": info.get("cte_name"),
+                        "column": info.get("column_name"),
+                    }
+                    impacted_ctes.append(entry)
+                else:
+                    entry = None
+                if entry is not None and not summary_only:
+                    entry["expression"] = render(info)
             # Also check if this dependent is used by other columns
             # (CTE columns can be referenced by other CTEs or output)
             parts = dep.split(".")
@@ -309,25 +477,6 @@ def find_impacted_columns(
                     if unknown_col_ref not in visited:
                         queue.append(unknown_col_ref)
 
-    # Categorize impacted columns
-    impacted_output = []
-    impacted_ctes = []
-
-    for col_id in impacted:
-        info = graph.get(col_id, {})
-        if info.get("location") == "output":
-            impacted_output.append({
-                "column": info.get("column_name"),
-                "position": info.get("output_position"),
-                "expression": info.get("expression"),
-            })
-        elif info.get("location") == "cte":
-            impacted_ctes.append({
-                "cte": info.get("cte_name"),
-                "column": info.get("column_name"),
-                "expression": info.get("expression"),
-            })
-
     return {
         "success": True,
         "source_column": source_column,
@@ -341,6 +490,56 @@ def find_impacted_columns(
     }
 
 
+class ImpactIndex(NamedTuple):
+    """Per-query structures that don't depend on the source column."""
+
+    ast: exp.Expression
+    graph: dict[str, dict]
+    reverse_index: dict[str, set[str]]
+    derived_names: frozenset[str]
+    cte_names: set[str]
+    sources_by_column: dict[str, list[str]]
+
+
+@functools.lru_cache(maxsize=32)
+def build_impact_index(sql: str, dialect: str) -> ImpactIndex:
+    """
+    Parse, qualify and index a query for impact analysis.
+
+    Cached on (sql, dialect) so probing several source columns of the same
+    query parses and qualifies it once; treat the result as read-only.
+    Raises SqlglotError if the SQL doesn't parse.
+    """
+    dialect_obj = _get_dialect(dialect)
+    parsed = sqlglot.parse_one(sql, dialect=dialect_obj)
+
+    # Qualify columns so dependency graph keeps base-table names (when available)
+    try:
+        ast = qualify(parsed, dialect=dialect_obj, validate_qualify_columns=False)
+    except SqlglotError:
+        ast = parsed
+
+    relations = index_relations(ast)
+    graph = build_dependency_graph(ast, relations)
+    reverse_index = build_reverse_index(graph)
+
+    # Get derived relation names (CTEs and inline subqueries) for transitive dependency tracking
+    derived_names = frozenset(
+        key.split(".")[0] for key in graph.keys() if key.split(".")[0] not in {"output", "unknown"}
+    )
+
+    cte_names = {cte.alias.lower() for cte in relations.ctes}
+
+    # Column name -> every source id ending in ".<column>", in reverse index order
+    sources_by_column: dict[str, list[str]] = {}
+    for source in reverse_index:
+        _, dot, column = source.rpartition(".")
+        if dot:
+            sources_by_column.setdefault(column, []).append(source)
+
+    return ImpactIndex(ast, graph, reverse_index, derived_names, cte_names, sources_by_column)
+
+
 def analyze_impact(
     sql: str,
     source_column: str,
@@ -369,7 +568,7 @@ def analyze_impact(
     dialect = dialect or "redshift"
 
     try:
-        parsed = sqlglot.parse_one(sql, dialect=dialect)
+        _, graph, reverse_index, derived_names, cte_names, sources_by_column = build_impact_index(sql, dialect)
     except SqlglotError as e:
         return {
             "success": False,
@@ -377,35 +576,22 @@ def analyze_impact(
             "hint": "Check SQL syntax or try a different dialect",
         }
 
-    # Qualify columns so dependency graph keeps base-table names (when available)
-    try:
-        ast = qualify(parsed, dialect=dialect, validate_qualify_columns=False)
-    except SqlglotError:
-        ast = parsed
-
-    # Build dependency graph
-    graph = build_dependency_graph(ast, max_expr_length, dialect)
-
-    # Build reverse index
-    reverse_index = build_reverse_index(graph)
-
-    # Get derived relation names (CTEs and inline subqueries) for transitive dependency tracking
-    derived_names = {key.split(".")[0] for key in graph.keys() if key.split(".")[0] not in {"output", "unknown"}}
-
     # Find impacted columns
-    result = find_impacted_columns(source_column, graph, reverse_index, derived_names)
+    result = find_impacted_columns(
+        source_column, graph, reverse_index, derived_names, dialect, max_expr_length, summary_only,
+        sources_by_column,
+    )
 
     # Add available source columns for reference
     if result.get("success"):
-        all_sources = sorted(list(reverse_index.keys()))
+        # Only the first max_sources are kept, so don't sort the rest
         if max_sources and max_sources > 0:
-            result["available_source_columns"] = all_sources[:max_sources]
+            result["available_source_columns"] = heapq.nsmallest(max_sources, reverse_index)
         else:
-            result["available_source_columns"] = all_sources
+            result["available_source_columns"] = sorted(reverse_index)
 
         # Add line numbers if requested
         if include_line_numbers:
-            cte_names = {cte.alias.lower() for cte in ast.find_all(exp.CTE)}
             line_info = find_line_numbers(sql, cte_names)
             result["line_numbers"] = line_info
 
@@ -422,13 +608,6 @@ def analyze_impact(
                     cte_line = line_info.get(f"cte:{cte_name}")
                     if cte_line:
                         col["line_hint"] = cte_line
-
-        # Remove expressions if summary_only
-        if summary_only:
-            for col in result.get("impacted_output_columns", []):
-                col.pop("expression", None)
-            for col in result.get("impacted_cte_columns", []):
-                col.pop("expression", None)
         if include_graph:
             result["graph"] = export_graph(graph)
 
@@ -440,24 +619,18 @@ def export_graph(graph: dict[str, dict]) -> dict[str, list[dict[str, str]]]:
     nodes: dict[str, dict[str, str]] = {}
     edges: list[dict[str, str]] = []
 
-    def add_node(node_id: str, kind: str, extra: dict[str, str] | None = None):
-        if node_id not in nodes:
-            nodes[node_id] = {"id": node_id, "kind": kind}
-            if extra:
-                nodes[node_id].update(extra)
-
+    # Build each node dict only the first time its id is seen
     for col_id, info in graph.items():
-        location = info.get("location", "unknown")
-        add_node(
-            col_id,
-            kind=location,
-            extra={
+        if col_id not in nodes:
+            nodes[col_id] = {
+                "id": col_id,
+                "kind": info.get("location", "unknown"),
                 "column": info.get("column_name", ""),
-                "label": f"{col_id}",
-            },
-        )
+                "label": col_id,
+            }
         for src in info.get("sources", []):
-            add_node(src, kind="source", extra={"label": src})
+            if src not in nodes:
+                nodes[src] = {"id": src, "kind": "source", "label": src}
             edges.append({"source": src, "target": col_id})
 
     return {"nodes": list(nodes.values()), "edges": edges}
@@ -486,14 +659,18 @@ def diff_impact(
     if not old_result.get("success"):
         return {"success": False, "error": f"Old SQL failed: {old_result.get('error')}"}
 
-    new_result = analyze_impact(
-        new_sql,
-        source_column,
-        dialect=dialect,
-        max_expr_length=max_expr_length,
-        summary_only=summary_only,
-        include_graph=include_graph,
-    )
+    if new_sql == old_sql:
+        # Identical inputs (e.g. CI comparing a file to itself) diff to nothing
+        new_result = old_result
+    else:
+        new_result = analyze_impact(
+            new_sql,
+            source_column,
+            dialect=dialect,
+            max_expr_length=max_expr_length,
+            summary_only=summary_only,
+            include_graph=include_graph,
+        )
     if not new_result.get("success"):
         return {"success": False, "error": f"New SQL failed: {new_result.get('error')}"}
 
@@ -568,8 +745,10 @@ def format_as_tree(result: dict) -> str:
         for col in result["impacted_output_columns"]:
             line_hint = f" (line ~{col['line_hint']})" if col.get("line_hint") else ""
             lines.append(f"  [{col['position']}] {col['column']}{line_hint}")
-            if col.get("expression"):
-                expr = col["expression"][:80] + "..." if len(col.get("expression", "")) > 80 else col.get("expression", "")
+            expr = col.get("expression")
+            if expr:
+                if len(expr) > 80:
+                    expr = expr[:80] + "..."
                 lines.append(f"      Expression: {expr}")
         lines.append("")
 
@@ -578,10 +757,7 @@ def format_as_tree(result: dict) -> str:
         # Group by CTE
         by_cte = {}
         for col in result["impacted_cte_columns"]:
-            cte = col["cte"]
-            if cte not in by_cte:
-                by_cte[cte] = []
-            by_cte[cte].append(col)
+            by_cte.setdefault(col["cte"], []).append(col)
 
         for cte, cols in by_cte.items():
             # Get line hint from first column in this CTE
@@ -710,10 +886,10 @@ Examples:
 
     if args.format == "tree":
         print(format_as_tree(result))
-    elif args.format == "graph":
-        print(json.dumps(result.get("graph") or result.get("graphs"), indent=2))
     else:
-        print(json.dumps(result, indent=2))
+        payload = result.get("graph") or result.get("graphs") if args.format == "graph" else result
+        dump_indented(payload, sys.stdout)
+        sys.stdout.write("\n")
 
     sys.exit(0 if result.get("success") else 1)
 
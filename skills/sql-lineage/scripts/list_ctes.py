@@ -15,6 +15,7 @@ Usage:
 """
 
 import argparse
+import functools
 import json
 import sys
 
@@ -36,19 +37,27 @@ def read_input(value: str) -> str:
     return value
 
 
-def extract_cte_info(cte: exp.CTE) -> dict:
-    """Extract information about a single CTE."""
+@functools.lru_cache(maxsize=128)
+def _parse_cached(sql: str, dialect: str | None) -> exp.Expression:
+    """Parse once per (sql, dialect) for repeated library calls; treat the result as read-only."""
+    return sqlglot.parse_one(sql, dialect=dialect)
+
+
+def extract_cte_info(cte: exp.CTE, tables: list[str] | None = None) -> dict:
+    """
+    Extract information about a single CTE.
+
+    tables, when given, are the CTE's distinct referenced table names in
+    first-seen order (see collect_ctes); otherwise they are found here.
+    """
     columns = []
     if hasattr(cte.this, 'selects'):
         for sel in cte.this.selects:
             columns.append(sel.alias_or_name)
     
     # Extract tables referenced in this CTE
-    tables = []
-    for table in cte.this.find_all(exp.Table):
-        table_name = table.name
-        if table_name and table_name not in tables:
-            tables.append(table_name)
+    if tables is None:
+        tables = list(dict.fromkeys(t.name for t in cte.this.find_all(exp.Table) if t.name))
     
     return {
         "name": cte.alias,
@@ -57,6 +66,32 @@ def extract_cte_info(cte: exp.CTE) -> dict:
     }
 
 
+def collect_ctes(ast: exp.Expression) -> list[tuple[exp.CTE, list[str]]]:
+    """
+    Find every CTE with its distinct referenced table names in one walk.
+
+    Matches find_all order: CTEs in BFS order, and each CTE's tables (nested
+    CTEs included) in first-seen order.
+    """
+    ctes: list[exp.CTE] = []
+    tables_in: dict[int, dict[str, None]] = {}
+    # id(node) -> ids of the CTEs whose body contains it
+    enclosing: dict[int, tuple[int, ...]] = {}
+
+    for node in ast.walk():
+        owners = enclosing.get(id(node.parent), ())
+        if isinstance(node, exp.CTE):
+            ctes.append(node)
+            tables_in[id(node)] = {}
+            owners += (id(node),)
+        elif isinstance(node, exp.Table) and node.name:
+            for owner in owners:
+                tables_in[owner].setdefault(node.name)
+        enclosing[id(node)] = owners
+
+    return [(cte, list(tables_in[id(cte)])) for cte in ctes]
+
+
 def list_ctes(sql: str, dialect: str | None = None) -> dict:
     """
     List all CTEs in a SQL query with their columns.
@@ -66,7 +101,7 @@ def list_ctes(sql: str, dialect: str | None = None) -> dict:
     dialect = dialect or "redshift"
     
     try:
-        ast = sqlglot.parse_one(sql, dialect=dialect)
+        ast = _parse_cached(sql, dialect)
     except SqlglotError as e:
         return {
             "success": False,
@@ -74,9 +109,7 @@ def list_ctes(sql: str, dialect: str | None = None) -> dict:
             "hint": "Check SQL syntax or try a different dialect",
         }
     
-    ctes = []
-    for cte in ast.find_all(exp.CTE):
-        ctes.append(extract_cte_info(cte))
+    ctes = [extract_cte_info(cte, tables) for cte, tables in collect_ctes(ast)]
     
     # Also get final output columns
     final_columns = []
@@ -118,6 +151,15 @@ def format_text(result: dict) -> str:
     return "\n".join(lines)
 
 
+def write_json(result: dict, compact: bool = False) -> None:
+    """Stream result to stdout as JSON; compact drops indentation and separator spaces."""
+    if compact:
+        json.dump(result, sys.stdout, separators=(",", ":"))
+    else:
+        json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="List all CTEs in a SQL query with their output columns",
@@ -150,6 +192,11 @@ Examples:
         default="text",
         help="Output format (default: text)",
     )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Emit JSON without indentation (json format only)",
+    )
     
     args = parser.parse_args()
     
@@ -157,7 +204,7 @@ Examples:
     result = list_ctes(sql, args.dialect)
     
     if args.format == "json":
-        print(json.dumps(result, indent=2))
+        write_json(result, args.compact)
     else:
         print(format_text(result))
     
@@ -13,10 +13,15 @@ Usage:
 """
 
 import argparse
+import functools
+import hashlib
 import json
+import os
 import sys
+from pathlib import Path
 
 import sqlglot
+from sqlglot import exp
 from sqlglot.errors import SqlglotError
 from sqlglot.optimizer.qualify import qualify
 
@@ -43,10 +48,26 @@ def parse_schema(schema_str: str | None) -> dict | None:
         sys.exit(f"Error: Invalid JSON schema: {e}")
 
 
-def qualify_query(sql: str, dialect: str | None = None, schema: dict | None = None) -> dict:
-    """Qualify all column references in a query."""
+@functools.lru_cache(maxsize=128)
+def _parse_cached(sql: str, dialect: str | None) -> exp.Expression:
+    """Parse once per (sql, dialect) for repeated library calls; copy before mutating."""
+    return sqlglot.parse_one(sql, dialect=dialect)
+
+
+def qualify_query(
+    sql: str,
+    dialect: str | None = None,
+    schema: dict | None = None,
+    pretty: bool = True,
+) -> dict:
+    """
+    Qualify all column references in a query.
+
+    pretty=False emits the qualified SQL on one line, skipping the formatter.
+    """
     try:
-        ast = sqlglot.parse_one(sql, dialect=dialect)
+        # qualify() rewrites the tree in place; keep the cached parse pristine
+        ast = _parse_cached(sql, dialect).copy()
 
         qualified = qualify(
             ast,
@@ -59,30 +80,121 @@ def qualify_query(sql: str, dialect: str | None = None, schema: dict | None = No
         return {
             "success": True,
             "original": sql,
-            "qualified": qualified.sql(dialect=dialect, pretty=True),
+            "qualified": qualified.sql(dialect=dialect, pretty=pretty),
         }
 
     except SqlglotError as e:
         return {"success": False, "error": str(e)}
 
 
+# Bump when the cached value changes meaning so stale entries are ignored
+CACHE_VERSION = 1
+
+
+def default_cache_dir() -> Path:
+    """Return the on-disk qualify cache directory (honours XDG_CACHE_HOME)."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join("~", ".cache")
+    return Path(base).expanduser() / "sql-lineage" / "qualify"
+
+
+def cache_key(
+    sql: str,
+    dialect: str | None = None,
+    schema: dict | None = None,
+    pretty: bool = True,
+) -> str:
+    """Hash everything that affects qualify_query output into a stable cache key."""
+    payload = "|".join([
+        str(CACHE_VERSION),
+        sqlglot.__version__,
+        sql,
+        dialect or "",
+        json.dumps(schema, sort_keys=True),
+        str(pretty),
+    ])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def qualify_query_cached(
+    sql: str,
+    dialect: str | None = None,
+    schema: dict | None = None,
+    cache_dir: Path | str | None = None,
+    pretty: bool = True,
+) -> dict:
+    """
+    qualify_query() memoized on disk under cache_dir.
+
+    Only the qualified SQL of successful results is stored; errors are
+    recomputed so they always reflect the current input.
+    """
+    if cache_dir is None:
+        return qualify_query(sql, dialect, schema, pretty)
+
+    path = Path(cache_dir) / f"{cache_key(sql, dialect, schema, pretty)}.sql"
+    # An unreadable or corrupt entry is a miss; it is recomputed and overwritten below
+    try:
+        return {"success": True, "original": sql, "qualified": path.read_text(encoding="utf-8")}
+    except (OSError, ValueError):
+        pass
+
+    result = qualify_query(sql, dialect, schema, pretty)
+    if result["success"]:
+        # Cache writes are best-effort; an unwritable cache dir must not fail qualification
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(result["qualified"], encoding="utf-8")
+            os.replace(tmp, path)
+        except OSError:
+            pass
+    return result
+
+
+def write_json(result: dict, compact: bool = False) -> None:
+    """Stream result to stdout as JSON; compact drops indentation and separator spaces."""
+    if compact:
+        json.dump(result, sys.stdout, separators=(",", ":"))
+    else:
+        json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Qualify column references in SQL")
     parser.add_argument("sql", help="SQL query or @filepath")
     parser.add_argument("--dialect", "-d", default=None)
     parser.add_argument("--schema", "-s", default=None, help="JSON schema")
     parser.add_argument("--sql-only", action="store_true", help="Output only the qualified SQL")
+    parser.add_argument(
+        "--pretty",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Format the qualified SQL over multiple lines (default: on; --no-pretty for one line)",
+    )
+    parser.add_argument("--compact", action="store_true", help="Emit JSON without indentation")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the on-disk result cache (~/.cache/sql-lineage/qualify)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory for the on-disk result cache (default: ~/.cache/sql-lineage/qualify)",
+    )
 
     args = parser.parse_args()
     sql = read_input(args.sql)
     schema = parse_schema(args.schema)
 
-    result = qualify_query(sql, args.dialect, schema)
+    cache_dir = None if args.no_cache else (args.cache_dir or default_cache_dir())
+    result = qualify_query_cached(sql, args.dialect, schema, cache_dir, args.pretty)
 
     if args.sql_only and result.get("success"):
         print(result["qualified"])
     else:
-        print(json.dumps(result, indent=2))
+        write_json(result, args.compact)
 
     sys.exit(0 if result.get("success") else 1)
 
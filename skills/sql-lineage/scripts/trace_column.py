@@ -15,9 +15,12 @@ Usage:
 """
 
 import argparse
+import functools
 import html
+import io
 import json
 import sys
+from collections import deque
 from typing import Any
 
 import sqlglot
@@ -80,6 +83,16 @@ def node_to_dict(node: Node, depth: int = 0, max_expr_length: int | None = None)
     return result
 
 
+@functools.lru_cache(maxsize=128)
+def _parse_cached(sql: str, dialect: str | None) -> exp.Expression:
+    """
+    Parse once per (sql, dialect) for repeated library calls.
+
+    Treat the result as read-only; lineage() works on its own copy.
+    """
+    return sqlglot.parse_one(sql, dialect=dialect)
+
+
 def extract_source_columns(
     expr: exp.Expression,
     alias_map: dict[str, exp.Expression] | None = None,
@@ -313,7 +326,7 @@ def trace_column_lineage(
 
     # First, parse the AST to check column locations
     try:
-        ast = sqlglot.parse_one(sql, dialect=dialect)
+        ast = _parse_cached(sql, dialect)
     except SqlglotError as e:
         return {
             "success": False,
@@ -343,16 +356,17 @@ def trace_column_lineage(
             node_to_index = {}
 
             # Use BFS to collect unique nodes and build edges
+            # Mark nodes when queued so shared nodes are queued only once
             unique_nodes = []
-            visited = set()
-            to_visit = [node]
+            visited = {id(node)}
+            to_visit = deque([node])
 
             while to_visit:
-                curr = to_visit.pop(0)
-                if id(curr) not in visited:
-                    visited.add(id(curr))
-                    unique_nodes.append(curr)
-                    for child in curr.downstream:
+                curr = to_visit.popleft()
+                unique_nodes.append(curr)
+                for child in curr.downstream:
+                    if id(child) not in visited:
+                        visited.add(id(child))
                         to_visit.append(child)
 
             # Assign indices
@@ -478,8 +492,11 @@ def format_output(result: dict, format_type: str) -> str:
                     # edge["from"] is child, edge["to"] is parent
                     children_map[edge["to"]].append(edge["from"])
 
-                # DFS helper
-                def print_node(node_idx, depth):
+                # Pre-order DFS from the root (index 0) with an explicit stack,
+                # so deep lineages don't hit the recursion limit
+                stack = [(0, 0)] if nodes else []
+                while stack:
+                    node_idx, depth = stack.pop()
                     node = nodes[node_idx]
                     indent = "  " * depth
 
@@ -491,12 +508,9 @@ def format_output(result: dict, format_type: str) -> str:
 
                     lines.append(f"{indent}{content}")
 
-                    for child_idx in children_map.get(node_idx, []):
-                        print_node(child_idx, depth + 1)
-
-                # Start from root (index 0)
-                if nodes:
-                    print_node(0, 0)
+                    # Push children reversed so they print in their original order
+                    for child_idx in reversed(children_map.get(node_idx, [])):
+                        stack.append((child_idx, depth + 1))
 
         else:
             lines.append(f"Error: {result['error']}")
@@ -514,29 +528,28 @@ def format_output(result: dict, format_type: str) -> str:
     return json.dumps(result, indent=2)
 
 
+def write_json(result: dict, compact: bool = False) -> None:
+    """Stream result to stdout as JSON; compact drops indentation and separator spaces."""
+    if compact:
+        json.dump(result, sys.stdout, separators=(",", ":"))
+    else:
+        json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
 def generate_html_visualization(result: dict) -> str:
     """Generate an HTML page with interactive lineage visualization."""
     if not result.get("success"):
         return f"<html><body><h1>Error</h1><p>{result.get('error')}</p></body></html>"
 
-    nodes_js = []
-    edges_js = []
-
-    for i, node in enumerate(result["nodes"]):
-        label_text = f"{node['table']}.{node['column']}" if node["type"] == "table" else node["expression"]
-        # Safe JSON serialization for label to prevent XSS and handle special chars
-        label = json.dumps(label_text or "UNKNOWN")
-        color = "#97C2FC" if node["type"] == "table" else "#FB7E81"
-        nodes_js.append(f'{{id: {i}, label: {label}, color: "{color}"}}')
-
-    for edge in result["edges"]:
-        edges_js.append(f'{{from: {edge["from"]}, to: {edge["to"]}, arrows: "to"}}')
-
     # Escape HTML content to prevent XSS
     escaped_column = html.escape(result['column'])
     escaped_tables = html.escape(', '.join(result['source_tables']))
 
-    return f"""<!DOCTYPE html>
+    # Write node and edge literals straight into one buffer instead of
+    # collecting a list of small strings to join
+    buf = io.StringIO()
+    buf.write(f"""<!DOCTYPE html>
 <html>
 <head>
     <title>Column Lineage: {escaped_column}</title>
@@ -551,15 +564,34 @@ def generate_html_visualization(result: dict) -> str:
     <p>Source tables: {escaped_tables}</p>
     <div id="graph"></div>
     <script>
-        var nodes = new vis.DataSet([{', '.join(nodes_js)}]);
-        var edges = new vis.DataSet([{', '.join(edges_js)}]);
+        var nodes = new vis.DataSet([""")
+
+    for i, node in enumerate(result["nodes"]):
+        label_text = f"{node['table']}.{node['column']}" if node["type"] == "table" else node["expression"]
+        # Safe JSON serialization for label to prevent XSS and handle special chars
+        label = json.dumps(label_text or "UNKNOWN")
+        color = "#97C2FC" if node["type"] == "table" else "#FB7E81"
+        if i:
+            buf.write(", ")
+        buf.write(f'{{id: {i}, label: {label}, color: "{color}"}}')
+
+    buf.write("""]);
+        var edges = new vis.DataSet([""")
+
+    for i, edge in enumerate(result["edges"]):
+        if i:
+            buf.write(", ")
+        buf.write(f'{{from: {edge["from"]}, to: {edge["to"]}, arrows: "to"}}')
+
+    buf.write("""]);
         var container = document.getElementById('graph');
-        var data = {{ nodes: nodes, edges: edges }};
-        var options = {{ layout: {{ hierarchical: {{ direction: 'UD' }} }} }};
+        var data = { nodes: nodes, edges: edges };
+        var options = { layout: { hierarchical: { direction: 'UD' } } };
         new vis.Network(container, data, options);
     </script>
 </body>
-</html>"""
+</html>""")
+    return buf.getvalue()
 
 
 def main():
@@ -619,6 +651,11 @@ Examples:
         default=None,
         help="Max depth for recursive CTE tracing (default: unlimited)",
     )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Emit JSON without indentation (json format only)",
+    )
 
     args = parser.parse_args()
 
@@ -626,7 +663,10 @@ Examples:
     schema = parse_schema(args.schema)
 
     result = trace_column_lineage(sql, args.column, args.dialect, schema, args.max_expr_length, args.depth)
-    print(format_output(result, args.format))
+    if args.format == "json":
+        write_json(result, args.compact)
+    else:
+        print(format_output(result, args.format))
 
     sys.exit(0 if result.get("success") else 1)
 
@@ -1,3 +1,5 @@
+import io
+import json
 import pytest
 import sys
 import os
@@ -5,7 +7,18 @@ import os
 # Add scripts directory to path to allow importing from kebab-case directory
 sys.path.append(os.path.abspath("skills/sql-lineage/scripts"))
 
-from analyze_query import analyze_query
+from analyze_query import (
+    analyze_batch,
+    analyze_query,
+    analyze_query_cached,
+    cache_key,
+    MAX_CACHED_SQL_LENGTH,
+    load_batch_manifest,
+    serve,
+    sources_as_pairs,
+    _memory_cache,
+)
+import sqlglot
 
 def test_analyze_simple_select():
     sql = "SELECT id, name FROM users WHERE active = true"
@@ -59,6 +72,14 @@ def test_analyze_aggregations():
     assert col_transforms["avg_sal"] == "aggregated"
     assert col_transforms["department"] == "passthrough" or "renamed"
 
+def test_rendering_does_not_rewrite_analyzed_nodes():
+    # Dialect transforms run while rendering must not leak into later analysis
+    result = analyze_query("SELECT b::text AS bt FROM t", "redshift")
+    assert result["columns"][0]["data_type"] == "TYPE.TEXT"
+
+    result = analyze_query("SELECT SUM(x) FILTER (WHERE y > 0) AS s FROM t", "snowflake")
+    assert result["aggregations"] == ['SUM("T"."X")']
+
 def test_analyze_create_table_as():
     sql = "CREATE TABLE new_users AS SELECT * FROM old_users"
     result = analyze_query(sql)
@@ -68,3 +89,108 @@ def test_analyze_create_table_as():
     assert result["target_table"] == "new_users"
     assert len(result["tables"]) == 1
     assert result["tables"][0]["name"] == "old_users"
+
+def test_cached_result_matches_uncached(tmp_path):
+    sql = "SELECT u.name, SUM(o.amount) AS total FROM orders o JOIN users u ON o.user_id = u.id GROUP BY u.name"
+    expected = analyze_query(sql, "redshift")
+
+    _memory_cache.clear()
+    first = analyze_query_cached(sql, "redshift", cache_dir=tmp_path)
+    assert first == expected
+    assert (tmp_path / f"{cache_key(sql, 'redshift')}.json").exists()
+
+    # Fresh process-level cache: the second call is served from disk
+    _memory_cache.clear()
+    second = analyze_query_cached(sql, "redshift", cache_dir=tmp_path)
+    assert second == expected
+    assert second is not first
+
+def test_corrupt_cache_entry_is_recomputed(tmp_path):
+    sql = "SELECT id FROM users"
+    path = tmp_path / f"{cache_key(sql, 'redshift')}.json"
+    path.write_text('{"success": tru', encoding="utf-8")
+
+    _memory_cache.clear()
+    assert analyze_query_cached(sql, "redshift", cache_dir=tmp_path) == analyze_query(sql, "redshift")
+    assert analyze_query_cached(sql, "redshift", cache_dir=tmp_path)["success"]
+    assert json.loads(path.read_text(encoding="utf-8"))["success"]
+
+def test_oversized_query_bypasses_cache(tmp_path):
+    sql = "SELECT id FROM users -- " + "x" * MAX_CACHED_SQL_LENGTH
+    _memory_cache.clear()
+    result = analyze_query_cached(sql, "redshift", cache_dir=tmp_path)
+    assert result["success"]
+    assert not _memory_cache
+    assert not list(tmp_path.iterdir())
+
+def test_cache_key_varies_with_inputs():
+    sql = "SELECT id FROM users"
+    base = cache_key(sql, "redshift")
+    assert cache_key(sql, "snowflake") != base
+    assert cache_key(sql, "redshift", {"users": {"id": "INT"}}) != base
+    assert cache_key(sql, "redshift", max_expr_length=10) != base
+
+def test_analyze_query_accepts_preparsed_ast():
+    sql = "WITH a AS (SELECT id FROM users) SELECT id FROM a"
+    ast = sqlglot.parse_one(sql, dialect="redshift")
+    assert analyze_query(sql, "redshift", ast=ast) == analyze_query(sql, "redshift")
+
+def test_load_batch_manifest_applies_defaults():
+    manifest = '["SELECT id FROM users", {"id": "q2", "sql": "SELECT 1", "dialect": "postgres"}]'
+    entries = load_batch_manifest(manifest, "redshift", {"users": {"id": "INT"}})
+    assert [e["id"] for e in entries] == [0, "q2"]
+    assert [e["dialect"] for e in entries] == ["redshift", "postgres"]
+    assert entries[1]["schema"] == {"users": {"id": "INT"}}
+
+def test_analyze_batch_keeps_manifest_order():
+    sqls = ["SELECT id FROM users", "SELECT amount FROM orders", "SELECT FROM WHERE"]
+    entries = load_batch_manifest(json.dumps(sqls), "redshift")
+    results = list(analyze_batch(entries, jobs=2))
+    assert [r["id"] for r in results] == [0, 1, 2]
+    assert results[0] == {"id": 0, **analyze_query(sqls[0], "redshift")}
+    assert results[1]["tables"][0]["name"] == "orders"
+    assert results[2]["success"] is False
+
+def test_load_batch_manifest_rejects_malformed_json():
+    with pytest.raises(SystemExit, match="Invalid batch manifest"):
+        load_batch_manifest("[bad")
+
+def test_analyze_batch_reports_bad_entries_in_place():
+    manifest = json.dumps([
+        "SELECT id FROM users",
+        {"sql": "SELECT a FROM t", "dialect": "nope"},
+        {"sql": "SELECT a FROM t", "schema": {"t": "x"}},
+        "SELECT amount FROM orders",
+    ])
+    results = list(analyze_batch(load_batch_manifest(manifest, "redshift"), jobs=1))
+    assert [r["id"] for r in results] == [0, 1, 2, 3]
+    assert [r["success"] for r in results] == [True, False, False, True]
+    assert results[1]["error"]
+
+def test_sources_as_pairs_replaces_source_dicts():
+    result = sources_as_pairs(analyze_query("SELECT o.amount * 2 AS doubled FROM orders o"))
+    col = result["columns"][0]
+    assert "sources" not in col
+    assert col["table_col_pairs"] == [["o", "amount"]]
+    assert list(col).index("table_col_pairs") == list(col).index("data_type") + 1
+
+def test_serve_answers_each_request_line():
+    requests = io.StringIO('"SELECT id FROM users"\n\nnot json\n{"id": "q", "sql": "SELECT 1"}\n')
+    responses = io.StringIO()
+    serve(requests, responses, "redshift")
+    results = [json.loads(line) for line in responses.getvalue().splitlines()]
+    assert results[0] == {"id": 0, **analyze_query("SELECT id FROM users", "redshift")}
+    assert results[1]["id"] == 2 and results[1]["success"] is False
+    assert results[2]["id"] == "q" and results[2]["success"] is True
+
+def test_serve_keeps_answering_after_a_bad_request():
+    requests = io.StringIO(
+        '{"sql": "SELECT a FROM t", "dialect": "nope"}\n'
+        '{"sql": "SELECT a FROM t", "schema": {"t": "x"}}\n'
+        '"SELECT id FROM users"\n'
+    )
+    responses = io.StringIO()
+    serve(requests, responses, "redshift")
+    results = [json.loads(line) for line in responses.getvalue().splitlines()]
+    assert [r["success"] for r in results] == [False, False, True]
+    assert results[2] == {"id": 2, **analyze_query("SELECT id FROM users", "redshift")}
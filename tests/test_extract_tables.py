@@ -5,7 +5,7 @@ import os
 # Add scripts directory to path to allow importing from kebab-case directory
 sys.path.append(os.path.abspath("skills/sql-lineage/scripts"))
 
-from extract_tables import extract_tables
+from extract_tables import extract_tables, extract_table_names
 
 def test_extract_basic():
     sql = "SELECT * FROM users"
@@ -59,3 +59,10 @@ def test_extract_cte_awareness():
     names = [t["name"] for t in result["tables"]]
     # Ideally 'raw_table' is there. 'cte' might be there depending on implementation.
     assert "raw_table" in names
+
+def test_extract_table_names_first_seen_order():
+    sql = "SELECT * FROM users u1 JOIN orders o ON o.user_id = u1.id JOIN users u2 ON u1.manager_id = u2.id"
+    result = extract_table_names(sql)
+    assert result["success"]
+    # One entry per table name, in the order the query first references it
+    assert result["names"] == ["users", "orders"]
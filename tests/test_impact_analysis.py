@@ -15,6 +15,7 @@ from analyze_query import (
 )
 from impact_analysis import (
     analyze_impact,
+    build_impact_index,
     build_dependency_graph,
     build_reverse_index,
     find_line_numbers,
@@ -190,6 +191,8 @@ class TestAggregationSemantics:
         assert "aggregation" in col
         assert col["aggregation"]["function"] == "DERIVED"
         assert "contains" in col["aggregation"]
+        functions = [agg["function"] for agg in col["aggregation"]["contains"]]
+        assert functions == ["SUM", "COUNT"]
 
     def test_non_aggregated_column_has_no_aggregation_field(self):
         sql = "SELECT id FROM orders"
@@ -233,6 +236,17 @@ class TestImpactAnalysis:
         assert result["success"] is False
         assert "available_sources" in result
 
+    def test_repeated_probes_reuse_the_index(self):
+        sql = "WITH c AS (SELECT amount, status FROM orders) SELECT amount, status FROM c"
+        first = analyze_impact(sql, "orders.amount")
+        hits = build_impact_index.cache_info().hits
+        second = analyze_impact(sql, "orders.status")
+
+        assert build_impact_index.cache_info().hits == hits + 1
+        assert first["impacted_output_columns"][0]["column"] == "amount"
+        assert second["impacted_output_columns"][0]["column"] == "status"
+        assert analyze_impact(sql, "orders.amount") == first
+
     def test_multiple_ctes_affected(self):
         """Source column affecting multiple CTEs."""
         sql = """
@@ -275,6 +289,13 @@ class TestBuildDependencyGraph:
         # Both a and b should have reverse mappings
         assert any("a" in k for k in reverse_index.keys()) or any("b" in k for k in reverse_index.keys())
 
+    def test_shared_alias_expands_for_every_reference(self):
+        sql = "SELECT a + b AS base, base * 2 AS x, base * 3 AS y FROM t"
+        graph = build_dependency_graph(sqlglot.parse_one(sql, dialect="redshift"))
+
+        for col in ("base", "x", "y"):
+            assert graph[f"output.{col}"]["sources"] == {"unknown.a", "unknown.b"}
+
 
 class TestEdgeCases:
     """Edge case tests for robustness."""
@@ -519,6 +540,14 @@ SELECT a, b, c FROM cte_a, cte_b, cte_c"""
         assert line_info["cte:cte_c"] == 4
         assert line_info["final_select"] == 5
 
+    def test_find_line_numbers_ctes_sharing_a_line(self):
+        """Every CTE defined on a line gets that line, not just the first match."""
+        sql = "WITH a AS (SELECT 1 AS x), b AS (SELECT x FROM a)\nSELECT x FROM b"
+        line_info = find_line_numbers(sql, {"a", "b"})
+
+        assert line_info["cte:a"] == 1
+        assert line_info["cte:b"] == 1
+
     def test_summary_only_with_line_numbers_combined(self):
         """Both flags should work together."""
         sql = """WITH calc AS (
@@ -124,6 +124,12 @@ class TestCteDependencyDiagram:
         assert "a" in deps["b"]
         assert "orders" in deps["b"]
 
+    def test_build_cte_dependencies_in_text_order(self):
+        sql = "WITH c AS (SELECT * FROM (SELECT * FROM t_first) s JOIN u_second ON 1=1) SELECT * FROM c"
+        deps = build_cte_dependencies(sqlglot.parse_one(sql, dialect="redshift"))
+
+        assert deps == {"c": ["t_first", "u_second"]}
+
     def test_format_as_diagram(self):
         result = {
             "ctes": [
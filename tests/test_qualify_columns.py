@@ -5,7 +5,7 @@ import os
 # Add scripts directory to path to allow importing from kebab-case directory
 sys.path.append(os.path.abspath("skills/sql-lineage/scripts"))
 
-from qualify_columns import qualify_query
+from qualify_columns import cache_key, qualify_query, qualify_query_cached
 
 
 def test_basic_qualification():
@@ -59,3 +59,45 @@ def test_dialect_specific():
     result = qualify_query(sql, dialect="bigquery")
 
     assert result["success"]
+
+
+def test_repeated_query_uses_each_schema():
+    # The parse is cached, so qualifying must not leak into later calls
+    sql = "SELECT id FROM users JOIN orders ON user_id = users.id"
+    first = qualify_query(sql, schema={"orders": {"id": "INT", "user_id": "INT"}})
+    second = qualify_query(sql, schema={"users": {"id": "INT"}, "orders": {"user_id": "INT"}})
+
+    assert first["success"] and second["success"]
+    assert "orders.id" in first["qualified"]
+    assert "users.id AS id" in second["qualified"]
+
+
+def test_no_pretty_is_single_line():
+    sql = "SELECT id, name FROM users"
+    result = qualify_query(sql, schema={"users": {"id": "INT", "name": "VARCHAR"}}, pretty=False)
+
+    assert result["success"]
+    assert result["qualified"] == "SELECT users.id AS id, users.name AS name FROM users AS users"
+
+
+def test_cached_result_matches_uncached(tmp_path):
+    sql = "SELECT id FROM users JOIN orders ON user_id = users.id"
+    schema = {"users": {"id": "INT"}, "orders": {"user_id": "INT"}}
+    expected = qualify_query(sql, schema=schema)
+
+    first = qualify_query_cached(sql, schema=schema, cache_dir=tmp_path)
+    assert first == expected
+    assert (tmp_path / f"{cache_key(sql, None, schema)}.sql").exists()
+
+    # Second call is served from disk; a different schema is a separate entry
+    assert qualify_query_cached(sql, schema=schema, cache_dir=tmp_path) == expected
+    assert cache_key(sql, None, schema) != cache_key(sql, None, {"users": {"id": "INT"}})
+
+
+def test_corrupt_cache_entry_is_recomputed(tmp_path):
+    sql = "SELECT id FROM users"
+    path = tmp_path / f"{cache_key(sql)}.sql"
+    path.write_bytes(b"\xff\xfe not utf-8")
+
+    assert qualify_query_cached(sql, cache_dir=tmp_path) == qualify_query(sql)
+    assert path.read_text(encoding="utf-8") == qualify_query(sql)["qualified"]